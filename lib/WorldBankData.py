@@ -23,12 +23,15 @@ with this program; if not, write to the Free Software Foundation, Inc.,
 
 """
 import os
+import re
+import bisect
 import zipfile
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 
 from countryCodeMapper import CountryCodeMapper
+from dataClassMapper   import dataClassMapper
 from utils import Settings, DoubleDict, splitNA, plotWithNA
 
 
@@ -38,6 +41,8 @@ class WorldBankIndicatorMapper(object):
     def __init__(self):
         
         self.fnameMapper = DoubleDict()
+        self.codes       = set()
+        self.index       = None # search index, built on first use
         
         nameList = [ ("Access to electricity (% of population)"                                            , "EG.ELC.ACCS.ZS")            ,\
                      ("Agricultural land (% of land area)"                                                 , "AG.LND.AGRI.ZS")            ,\
@@ -51,11 +56,11 @@ class WorldBankIndicatorMapper(object):
                      ("Children in employment, male (% of male children ages 7-14)"                        , "SL.TLF.0714.MA.ZS")         ,\
                      ("Children out of school, primary, female"                                            , "SE.PRM.UNER.FE")            ,\
                      ("Children out of school, primary, male"                                              , "SE.PRM.UNER.MA")            ,\
-                     ("Claims on central government (annual growth as % of broad money"                    , "FM.AST.CGOV.ZG.M3")         ,\
+                     ("Claims on central government (annual growth as % of broad money)"                   , "FM.AST.CGOV.ZG.M3")         ,\
                      ("Claims on other sectors of the domestic economy (annual growth as % of broad money)", "FM.AST.DOMO.ZG.M3")         ,\
                      ("Combustible renewables and waste (% of total energy)"                               , "EG.USE.CRNW.ZS")            ,\
                      ("CO2 emissions (metric tons per capita)"                                             , "EN.ATM.CO2E.PC")            ,\
-                     ("CO2 emissions (kt)]"                                                                , "EN.ATM.CO2E.KT")            ,\
+                     ("CO2 emissions (kt)"                                                                 , "EN.ATM.CO2E.KT")            ,\
                      ("Current account balance (BoP, current US$)"                                         , "BN.CAB.XOKA.CD")            ,\
                      ("Deposit interest rate (%)"                                                          , "FR.INR.DPST")               ,\
                      ("Depth of credit information index (0=low to 8=high)"                                , "IC.CRD.INFO.XQ")            ,\
@@ -87,7 +92,7 @@ class WorldBankIndicatorMapper(object):
                      ("Gross intake ratio in first grade of primary education, male (% of relevant age group)"  , "SE.PRM.GINT.MA.ZS")    ,\
                      ("Gross savings (% of GDP)"                                                                , "NY.GNS.ICTR.ZS")       ,\
                      ("Health expenditure per capita (current US$)"                                             , "SH.XPD.PCAP")          ,\
-                     ("Health expenditure, public (% of total health expenditure"                               , "SH.XPD.PUBL")          ,\
+                     ("Health expenditure, public (% of total health expenditure)"                              , "SH.XPD.PUBL")          ,\
                      ("Health expenditure, total (% of GDP)"                                                    , "SH.XPD.TOTL.ZS")       ,\
                      ("Improved sanitation facilities (% of population with access)"                            , "SH.STA.ACSN")          ,\
                      ("Improved water source, rural (% of rural population with access)"                        , "SH.H2O.SAFE.RU.ZS")    ,\
@@ -105,11 +110,11 @@ class WorldBankIndicatorMapper(object):
                      ("Inflation, GDP deflator (annual %)"                                                      , "NY.GDP.DEFL.KD.ZG")    ,\
                      ("Informal payments to public officials (% of firms)"                                      , "IC.FRM.CORR.ZS")       ,\
                      ("Internationally-recognized quality certification (% of firms)"                           , "IC.FRM.ISOC.ZS")       ,\
-                     ("Investment in energy with private participation (current US$"                            , "IE.PPI.ENGY.CD")       ,\
+                     ("Investment in energy with private participation (current US$)"                           , "IE.PPI.ENGY.CD")       ,\
                      ("Investment in telecoms with private participation (current US$)"                         , "IE.PPI.TELE.CD")       ,\
                      ("Investment in transport with private participation (current US$)"                        , "IE.PPI.TRAN.CD")       ,\
                      ("Investment in water and sanitation with private participation (current US$)"             , "IE.PPI.WATR.CD")       ,\
-                     ("Labor force, total]"                                                                     , "SL.TLF.TOTL.IN")       ,\
+                     ("Labor force, total"                                                                      , "SL.TLF.TOTL.IN")       ,\
                      ("Land area (sq. km)"                                                                      , "AG.LND.TOTL.K2")       ,\
                      ("Lending interest rate (%)"                                                               , "FR.INR.LEND")          ,\
                      ("Life expectancy at birth, female (years)"                                                , "SP.DYN.LE00.FE.IN")    ,\
@@ -118,7 +123,7 @@ class WorldBankIndicatorMapper(object):
                      ("Literacy rate, youth female (% of females ages 15-24)"                                   , "SE.ADT.1524.LT.FE.ZS") ,\
                      ("Literacy rate, youth male (% of males ages 15-24)"                                       , "SE.ADT.1524.LT.MA.ZS") ,\
                      ("Literacy rate, youth total (% of people ages 15-24)"                                     , "SE.ADT.1524.LT.ZS")  ,\
-                     ("Long-term unemployment, female (% of female unemployment"                                , "SL.UEM.LTRM.FE.ZS")  ,\
+                     ("Long-term unemployment, female (% of female unemployment)"                               , "SL.UEM.LTRM.FE.ZS")  ,\
                      ("Long-term unemployment, male (% of male unemployment)"                                   , "SL.UEM.LTRM.MA.ZS")  ,\
                      ("Mammal species, threatened"                                                              , "EN.MAM.THRD.NO")     ,\
                      ("Marine protected areas (% of territorial waters)"                                        , "ER.MRN.PTMR.ZS")     ,\
@@ -199,7 +204,44 @@ class WorldBankIndicatorMapper(object):
         
         # Add the data to the mapper
         for name, ID in nameList:
-            self.fnameMapper[name.upper()] = ID.upper()
+            self.add(name, ID)
+    
+    def add(self, name, ID):
+        """
+        Register an indicator, i.e. its full name and its code.
+        
+        Input:
+          name (str):  The World Bank indicator name
+          
+          ID (str):    The World Bank indicator code
+          
+        """
+        self.fnameMapper[name.upper()] = ID.upper()
+        self.codes.add(ID.upper())
+        self.index = None # must be rebuilt
+    
+    def addMetadata(self, dataFrame):
+        """
+        Register all indicators listed in a World Bank metadata table.
+        
+        Both the metadata shipped with the single indicator downloads
+        (columns INDICATOR_CODE and INDICATOR_NAME) and the series table of
+        the bulk download (columns "Series Code" and "Indicator Name") are
+        understood. Returns the number of registered indicators.
+        
+        Input:
+          dataFrame (DataFrame):  The metadata table
+          
+        """
+        for code, name in [ ("INDICATOR_CODE", "INDICATOR_NAME") ,\
+                            ("Series Code",    "Indicator Name") ,\
+                            ("Indicator Code", "Indicator Name") ]:
+            if code in dataFrame.columns and name in dataFrame.columns:
+                pairs = dataFrame[[name, code]].dropna().drop_duplicates()
+                for indicatorName, ID in pairs.itertuples(index=False):
+                    self.add(indicatorName, ID)
+                return len(pairs)
+        return 0
     
     def __call__(self, indicator):
         """
@@ -211,19 +253,184 @@ class WorldBankIndicatorMapper(object):
           
         """
         if indicator.upper() not in self.fnameMapper.keys():
-            print("The indicator was not found. Sorry!")
+            suggestions = self.search(indicator, n=3)
+            if len(suggestions) == 0:
+                print("The indicator was not found. Sorry!")
+            else:
+                print("The indicator was not found. Did you mean:")
+                for code, name, _ in suggestions:
+                    print("  %s\t%s" %(code, name))
             return False
         else:
             return self.fnameMapper[indicator.upper()]
+    
+    def isCode(self, indicator):
+        """ Check if indicator is an indicator code (and not a name). """
+        return indicator.upper() in self.codes
+    
+    def code(self, indicator):
+        """ Return the indicator code for an indicator name or code. """
+        if self.isCode(indicator):
+            return indicator.upper()
+        return self(indicator)
+    
+    def name(self, indicator):
+        """ Return the (upper case) indicator name for an indicator name or code. """
+        if self.isCode(indicator):
+            return self.fnameMapper[indicator.upper()]
+        elif self(indicator):
+            return indicator.upper()
+        return False
+    
+    def search(self, query, n=10):
+        """
+        Search the indicators by (parts of) their name, code or category.
+        
+        The words of the query are matched against the words of the indicator
+        names and categories and against the codes. Exact matches rank
+        highest, followed by prefix matches and similar words (which allows
+        for typos). Returns a list of (code, name, category) tuples, best
+        match first.
+        
+        Input:
+          query (str):  The search string, e.g. "co2 emis" or "EN.ATM"
+          
+          n (int):      Maximal number of results
+          
+        """
+        if self.index is None:
+            self.index = IndicatorIndex(self._entries())
+        return self.index.search(query, n)
+    
+    def _entries(self):
+        """ List all registered indicators as (code, name, category) """
+        categories = dataClassMapper()
+        
+        entries = list()
+        for code in sorted(self.codes):
+            name     = self.fnameMapper[code]
+            category = categories(code)[0]
+            entries.append( (code, name, category if category != "None" else "") )
+        return entries
+
+
+class IndicatorIndex(object):
+    
+    def __init__(self, entries):
+        """
+        Search index over the World Bank indicators.
+        
+        The index is built once. It maps each word of the indicator names and
+        categories to the indicators containing it, and each trigram of
+        these words to the words containing it. The words and the codes are
+        additionally kept sorted to find prefix matches by bisection.
+        
+        Input:
+          entries (list):  List of (code, name, category) tuples
+          
+        """
+        self.entries  = entries
+        self.words    = dict() # word -> set of entries
+        self.trigrams = dict() # trigram -> set of words
+        
+        for idx, (code, name, category) in enumerate(entries):
+            for word in self._tokenize(name + " " + category):
+                self.words.setdefault(word, set()).add(idx)
+        
+        self.sizes = dict() # word -> number of trigrams
+        for word in self.words:
+            trigrams = self._trigrams(word)
+            self.sizes[word] = len(trigrams)
+            for trigram in trigrams:
+                self.trigrams.setdefault(trigram, set()).add(word)
+        
+        self.sortedWords = sorted(self.words)
+        self.sortedCodes = sorted( (code.upper(), idx) for idx, (code, _, _) in enumerate(entries) )
+    
+    def search(self, query, n=10):
+        """ Rank the entries for query, see WorldBankIndicatorMapper.search() """
+        scores = dict()
+        
+        # Codes are matched as a whole (by prefix)
+        code = query.strip().upper()
+        if len(code) > 0:
+            start = bisect.bisect_left(self.sortedCodes, (code, -1))
+            for candidate, idx in self.sortedCodes[start:]:
+                if not candidate.startswith(code):
+                    break
+                scores[idx] = scores.get(idx, 0) + (4.0 if candidate == code else 3.0)
+        
+        for token in self._tokenize(query):
+            best = dict() # best match of this token for each entry
+            for word, score in self._match(token):
+                for idx in self.words[word]:
+                    if score > best.get(idx, 0):
+                        best[idx] = score
+            for idx, score in best.items():
+                scores[idx] = scores.get(idx, 0) + score
+        
+        # Rank by score, prefer short names on ties
+        ranked = sorted(scores, key=lambda idx: (-scores[idx], len(self.entries[idx][1]), idx))
+        return [ self.entries[idx] for idx in ranked[:n] ]
+    
+    def _match(self, token):
+        """ Find the words matching token with a score in (0,1]. """
+        matches = dict()
+        
+        # Exact and prefix matches
+        start = bisect.bisect_left(self.sortedWords, token)
+        for word in self.sortedWords[start:]:
+            if not word.startswith(token):
+                break
+            matches[word] = 1.0 if word == token else 0.8
+        
+        # Similar words (share most of their trigrams)
+        trigrams = self._trigrams(token)
+        shared   = dict()
+        for trigram in trigrams:
+            for word in self.trigrams.get(trigram, ()):
+                shared[word] = shared.get(word, 0) + 1
+        for word, count in shared.items():
+            similarity = count / float(len(trigrams) + self.sizes[word] - count)
+            if similarity >= 0.4 and word not in matches:
+                matches[word] = 0.6 * similarity
+        
+        return matches.items()
+    
+    @staticmethod
+    def _tokenize(text):
+        return re.findall(r"[a-z0-9$%]+", text.lower())
+    
+    @staticmethod
+    def _trigrams(word):
+        word = " %s " %word
+        return set( word[i:i+3] for i in range(len(word)-2) )
 
 
 class WorldBankData(Settings):
     
-    def __init__(self, folder):
+    def __init__(self, folder, chunksize=5000):
+        """
+        Container for the World Bank Data.
+        
+        All .zip files in folder are loaded. These can either be the single
+        indicator downloads (one indicator per file) or the bulk download of
+        the World Development Indicators (WDI_csv.zip) containing all
+        indicators in one table. The indicator names are taken from the
+        metadata shipped with the files.
+        
+        Input:
+          folder (str):     The folder containing the World Bank .zip files
+          
+          chunksize (int):  Number of rows of the bulk table that are read at
+                            once. Limits the memory needed for the raw table.
+        """
         super(WorldBankData, self).__init__()
         
         self.folder          = folder
         self.data            = None
+        self.dataLong        = None # long format: Country, Year, Indicator, Value
+        self.chunksize       = chunksize
         self.yearLimit       = 1980 # only data until here is taken
         self.WorldBankMapper = WorldBankIndicatorMapper()
         self.countryMapper   = CountryCodeMapper()
@@ -232,55 +439,126 @@ class WorldBankData(Settings):
     
     def _load(self, folder):
         # Get the filename in the folder
-        fnames = [ os.path.join(folder,fname) for fname in os.listdir(folder) \
+        fnames = [ os.path.join(folder,fname) for fname in sorted(os.listdir(folder)) \
                                               if fname[-4:] == ".zip" ]
         
-        # Load all the data into one pandas data frame
+        # Each chunk of the raw tables is reshaped into the long format right
+        # away, i.e. only one chunk of the wide raw table is in memory.
+        chunks    = list()
+        countries = set()
         for fname in fnames:
-            indicator = os.path.split(fname)[1].split('_')[0]
-            if not self.WorldBankMapper(indicator):
-                print("The indicator %s not found in the database. Not loading." %indicator)
-                continue
-            
             assert( zipfile.is_zipfile(fname) ) # sanity check
-#            print("Adding indicator\t%s" %self.WorldBankMapper(indicator) )
             
-            # Open the zipfile and load the data
             with zipfile.ZipFile(fname, "r") as f:
-                # The zipfile contains four files, only one of them contains
-                # the data we're interested in. 
-                name = [ i for i in f.namelist() if i.split('_')[0] !="Metadata" and not i[0] == "[" ]
-                assert( len(name) == 1 ) # sanity check
-                # Load the data into a pandas data frame
-                dataFrame = pd.read_csv(f.open(name[0]), skiprows=4)
-                # The data is not stored in for us convenient way. Transform it
-                dataFrame = self._reshape(dataFrame)
-                
-                # Merge this dataFrame into the big one
-                if self.data is None:
-                    self.data = dataFrame
-                else:
-                    self.data = pd.merge(self.data, dataFrame, on=["Country Code","Year"], how="outer")
-        
-        # Rename the column "Country Code" to "Country"
-        index = ["Country"]
-        index.extend(self.data.columns[1:])
-        self.data.columns = index
-        
-        # Convert the "Year" column to numeric
-        self.data = self.data.convert_objects(convert_numeric=True)
+                for dataFrame in self._read(f):
+                    countries.update(dataFrame["Country Code"].dropna())
+                    chunks.append( self._reshape(dataFrame) )
+        
+        if len(chunks) == 0:
+            print("No World Bank data found in %s" %folder)
+            return
+        
+        self.dataLong = self._concat(chunks, countries)
+        self.data     = self._pivot(self.dataLong)
         return
+    
+    def _read(self, f):
+        """
+        Generator over the data tables in the zipfile f.
         
+        The bulk download is read in chunks of self.chunksize rows, the single
+        indicator files are small and are read at once. The indicators are
+        registered in the WorldBankMapper using the metadata of the file.
+        """
+        names = f.namelist()
+        bulk  = [ i for i in names if re.match(r"^WDI_?Data\.csv$", os.path.split(i)[1]) ]
+        
+        if len(bulk) > 0:
+            # The bulk download comes with a table describing all indicators
+            series = [ i for i in names if re.match(r"^WDI_?Series\.csv$", os.path.split(i)[1]) ]
+            if len(series) > 0:
+                self.WorldBankMapper.addMetadata( pd.read_csv(f.open(series[0])) )
+            
+            for dataFrame in pd.read_csv(f.open(bulk[0]), chunksize=self.chunksize):
+                # Fall back to the names in the data table itself
+                if len(series) == 0:
+                    self.WorldBankMapper.addMetadata(dataFrame)
+                yield dataFrame
+            return
+        
+        # The zipfile contains four files, only one of them contains
+        # the data we're interested in. The metadata file describes the
+        # indicator.
+        metadata = [ i for i in names if i.split('_')[:2] == ["Metadata", "Indicator"] ]
+        for item in metadata:
+            self.WorldBankMapper.addMetadata( pd.read_csv(f.open(item)) )
+        
+        name = [ i for i in names if i.split('_')[0] !="Metadata" and not i[0] == "[" ]
+        assert( len(name) == 1 ) # sanity check
+        
+        dataFrame = pd.read_csv(f.open(name[0]), skiprows=4)
+        indicator = dataFrame["Indicator Code"].dropna().unique()
+        if len(indicator) == 0 or not self.WorldBankMapper(indicator[0]):
+            print("The indicator in %s not found in the metadata. Not loading." %f.filename)
+            return
+        yield dataFrame
 
     def _reshape(self, dataFrame):
-        """ Reshape the original World Bank .csv file table. """
+        """
+        Reshape the original World Bank .csv table into the long format.
+        
+        Only the years later or equal than yearLimit and only the non missing
+        values are kept. Returns a dict with the columns as numpy arrays.
+        """
         # Get all the years present in the data (only later or equal than yearLimit)
         colNames = [ name for name in dataFrame.columns if name.isdigit() and int(name) >= self.yearLimit ]
         
-        # Reshape the dataframe and assignt the column names
-        dataTmp = pd.melt(dataFrame, id_vars=["Country Code"], value_vars=colNames)
-        dataTmp.columns = ["Country Code", "Year", dataFrame["Indicator Code"][0]]
-        return(dataTmp)
+        values = dataFrame[colNames].values.astype(np.float64)
+        row, col = np.nonzero( pd.notnull(values) )
+        
+        return { "Country"   : dataFrame["Country Code"].values[row]               ,\
+                 "Year"      : np.asarray(colNames, dtype=np.int16)[col]            ,\
+                 "Indicator" : dataFrame["Indicator Code"].str.upper().values[row] ,\
+                 "Value"     : values[row,col]
+               }
+    
+    def _concat(self, chunks, countries):
+        """ Combine the reshaped chunks into the long format DataFrame. """
+        def column(name):
+            return np.concatenate([ chunk[name] for chunk in chunks ])
+        
+        countries = sorted( c for c in countries if isinstance(c, str) )
+        dataLong  = pd.DataFrame( { "Country"   : pd.Categorical(column("Country"), categories=countries) ,\
+                                    "Year"      : column("Year")                                          ,\
+                                    "Indicator" : pd.Categorical(column("Indicator"))                     ,\
+                                    "Value"     : column("Value")
+                                  } )
+        # Drop rows without country code
+        dataLong = dataLong[ dataLong["Country"].notnull() ]
+        dataLong.reset_index(drop=True, inplace=True)
+        return dataLong
+    
+    def _pivot(self, dataLong):
+        """
+        Convert the long format into one column per indicator. Every country
+        gets one row for each year.
+        """
+        countries  = dataLong["Country"].cat.categories
+        indicators = dataLong["Indicator"].cat.categories
+        years      = np.arange(dataLong["Year"].min(), dataLong["Year"].max()+1)
+        
+        # Position of each value in the (country, year) x indicator table
+        row = dataLong["Country"].cat.codes.values.astype(np.int64) * len(years) + \
+              (dataLong["Year"].values - years[0])
+        col = dataLong["Indicator"].cat.codes.values
+        
+        values = np.full( (len(countries)*len(years), len(indicators)), np.nan )
+        values[row, col] = dataLong["Value"].values
+        
+        data = pd.DataFrame(values, columns=list(indicators))
+        data.insert(0, "Year",    np.tile(years, len(countries)))
+        data.insert(0, "Country", np.repeat(np.asarray(countries), len(years)))
+        return data
 
     def indicator(self, countryList, name):
         """
@@ -327,12 +605,9 @@ class WorldBankData(Settings):
             return
 
         ## Check the World Bank Indicator
-        if not self.WorldBankMapper(name): # World Bank Indicator not understood
-            return                         # Message will be printed to screen
-        
-        if name[2] != '.': # This is a pretty ugly comparison.. but hopefully
-                           # will do.
-            name = self.WorldBankMapper(name) # Map to indicator code
+        name = self.WorldBankMapper.code(name) # Map to indicator code
+        if not name:   # World Bank Indicator not understood
+            return     # Message will be printed to screen
         
         x, y, c = list(), list(), list()
         for country in countryList:
@@ -403,13 +678,10 @@ class WorldBankData(Settings):
             return
         
         # Assemble the figure title
-        if name[2] == '.': # This is a pretty ugly comparison.. but hopefully
-                           # will do.
-            name = self.WorldBankMapper(name) # Map to indicator code
+        name = self.WorldBankMapper.name(name) # Map to indicator name
         
         if normalise_by is not None:
-            if normalise_by[2] == '.':
-                normalise_by = self.WorldBankMapper(normalise_by) # Map to indicator code
+            normalise_by = self.WorldBankMapper.name(normalise_by) # Map to indicator name
             if in_percent:
                 name = name + " [conv. to real unit]"
             else:
@@ -9,11 +9,25 @@ from geopy.geocoders import Nominatim
 import pandas as pd
 from time import sleep
 import numpy as np
-import tempfile
 import tarfile
 import os
-import shutil
+import json
+import zlib
+import hashlib
+from scipy import sparse
+from scipy.spatial import cKDTree
 from datetime import datetime
+from collections import deque
+from tableCache import TableCache
+from monthMasks import MonthMasks, NO_DATA
+from concurrent.futures import ProcessPoolExecutor
+
+# The elements used from the daily climate data
+ELEMENTS = ["PRCP", "SNOW", "SNWD", "TMAX", "TMIN", "AWND"]
+
+# Increase if the processing changes, i.e. if cached results become invalid
+CACHE_VERSION = 2
+
 
 class WeatherData(object):
     
@@ -21,7 +35,21 @@ class WeatherData(object):
                        years=None                                             ,\
                        stationList="../data/climate/ghcnd-stations.txt"       ,\
                        LatLon2Counry="../data/geolocation/LatLon2Country.csv" ,\
-                       optimiseFactor = False
+                       optimiseFactor = False                                 ,\
+                       processes = 1                                          ,\
+                       elements = None                                        ,\
+                       factor = 1.54                                          ,\
+                       firstYear = 1950                                       ,\
+                       lastYear = 2013                                        ,\
+                       cache = None                                           ,\
+                       keepStations = True                                    ,\
+                       chunksize = 1000                                       ,\
+                       inventory = None                                       ,\
+                       weighted = False                                       ,\
+                       shard = None                                           ,\
+                       numShards = 1                                          ,\
+                       shardFolder = None                                     ,\
+                       maxDistance = 5.
                 ):
         """
         Load all the climate data published at: See: ftp://ftp.ncdc.noaa.gov/pub/data/ghcn/daily/
@@ -31,11 +59,16 @@ class WeatherData(object):
         range from 0 to 12 depending on how many months of one year were
         classified as extreme.
         
+        The result is cached (see TableCache), keyed by the content of the
+        input files and the parameters, i.e. it is only rebuilt if one of
+        them changes.
+        
         Please also refer to notebooks/
         
         Input:
         
           fname (str):           Location of the input database, i.e. ghcnd_gsn.tar.gz
+                                 or a precompiled .csv file
           
           years (list):          List of two integers specifing the year range that
                                  should be kept.
@@ -48,62 +81,362 @@ class WeatherData(object):
           optimiseFactor (bool): Only needed to set the optimal threshold for
                                  classifing climate events as extreme. See
                                  notebooks for more detail.
+          
+          processes (int):       Number of processes used to parse the station
+                                 files. None uses all available cores.
+          
+          elements (list):       The elements to use, defaults to ELEMENTS
+          
+          factor (float):        Number of standard deviations a month must
+                                 deviate to be extreme (see notebooks)
+          
+          firstYear (int):       Only use stations (elements) measuring since
+                                 firstYear or earlier..
+          
+          lastYear (int):        ..and until lastYear or later
+          
+          cache (str):           The cache folder, defaults to the folder
+                                 "cache" next to fname. False disables the cache.
+          
+          keepStations (bool):   Keep all stations in memory (see __iter__).
+                                 Set to False for large archives
+                                 (e.g. ghcnd_all.tar.gz), the stations are then
+                                 processed in chunks and released.
+          
+          chunksize (int):       Number of stations per chunk if the stations
+                                 are not kept
+          
+          inventory (str):       Location of the inventory file, i.e.
+                                 ghcnd-inventory.txt. Gives the year span of
+                                 each station and element, stations (elements)
+                                 that cannot meet firstYear and lastYear are
+                                 not parsed. Without the inventory (or for
+                                 stations missing in it) the span is scanned
+                                 from the station file (see scanSpans()).
+          
+          weighted (bool):       Weight the stations of a country by the share
+                                 of the country's area they cover (see
+                                 LatLon2Country.weights()) instead of taking
+                                 the plain average
+          
+          shard (int):           Only build shard (0..numShards-1) of the
+                                 stations and write its monthly counts to
+                                 shardFolder, self.data stays None. The
+                                 stations are assigned to the shards by the
+                                 checksum (crc32) of their ID.
+          
+          numShards (int):       Number of shards. With shard=None and more
+                                 than one shard the data is merged from the
+                                 files of all shards, i.e. from the output of
+                                 WeatherData(..., shard=i, numShards=n) for
+                                 all i (e.g. run on different machines).
+          
+          shardFolder (str):     Folder of the shard files (shared by all
+                                 machines), defaults to the folder "shards"
+                                 next to fname
+          
+          maxDistance (float):   Maximal distance in km of a station to the
+                                 nearest known location of its country (see
+                                 WeatherStationMapper)
         """
-        self.fname  = fname
-        self.mapper = WeatherStationMapper(stationList, LatLon2Counry)
+        self.fname          = fname
+        self.stationList    = stationList
+        self.LatLon2Country = LatLon2Counry
+        self.processes      = processes or os.cpu_count() or 1
+        self.elements       = list(ELEMENTS if elements is None else elements)
+        self.factor         = factor
+        self.firstYear      = firstYear
+        self.lastYear       = lastYear
+        self.chunksize      = chunksize
+        self.inventoryFile  = inventory
+        self.inventory      = readInventory(inventory) if inventory else dict()
+        self.weighted       = weighted
+        self.shard          = shard
+        self.numShards      = numShards
+        self.shardFolder    = shardFolder or os.path.join(os.path.dirname(fname), "shards")
+        if shard is not None and not 0 <= shard < numShards:
+            raise ValueError("shard must be within 0..%d (numShards=%d), got %r" %(numShards-1, numShards, shard))
+        self.maxDistance    = maxDistance
+        self.statistics     = None # see sweep_factor()
+        self.stations       = list()
+        self.data           = None
+        self.masks          = None # which months were extreme, see MonthMasks
+        self._mapper        = None # see mapper
         
         if years is None:
             years = [1800, 2100]
+        self.years = years
+        
+        if cache is None:
+            cache = os.path.join(os.path.dirname(fname), "cache")
+        self.cache = TableCache(cache) if cache else None
         
         # Check if the data is created from scratch or a precompiled copy
         # can be read in.
         startTime = datetime.now() # set the calculation start time
         
-        if os.path.isfile("../data/climate/ghcnd_gsn.csv") or fname[-4:] == ".csv":
+        if self.shard is not None:
+            print("Generating shard %d of %d from the original data.." %(self.shard, self.numShards))
+            counts = self._count( self._iterStations(fname, years) )
+            self._saveShard(counts, years)
+        elif fname[-4:] == ".csv":
             print("Loading the data from prebuild source..")
             if optimiseFactor:
                 print("Not rebuilding the data. Cannot give you the full DataFrame.")
-            if fname[-4:] == ".csv":
-                self.data = pd.DataFrame.from_csv(fname)
-            else:
-                self.data = pd.DataFrame.from_csv("../data/climate/ghcnd_gsn.csv")
+            self.data = pd.read_csv(fname, index_col=0)
             self.data.reset_index(inplace=True)
         else:
-            print("Generating the data from the original data..")
-            self.stations = self._loadTar(fname, years)
-            self.data     = self._combine(self.stations, optimiseFactor)
-            self.data.to_csv(fname[:-6]+"csv", index=False)
+            # The full DataFrame of optimiseFactor is not cached
+            key = None
+            if self.cache is not None and not optimiseFactor:
+                key = self._cacheKey(years)
+                self.data = self.cache.load(key)
+                masks     = self.cache.load(self._cacheKey(years, "masks"))
+                if masks is not None:
+                    self.masks = MonthMasks.fromFrame(masks, self.elements)
+            
+            if self.data is not None:
+                print("Loading the data from the cache..")
+            else:
+                if self.numShards > 1 and not optimiseFactor:
+                    print("Merging the data of %d shards.." %self.numShards)
+                    self.data = self._finish( self._mergeShards(years) )
+                else:
+                    print("Generating the data from the original data..")
+                    if keepStations or optimiseFactor:
+                        self.stations = self._loadTar(fname, years)
+                        self.data     = self._combine(self.stations, optimiseFactor)
+                    else:
+                        self.data     = self._reduce( self._iterStations(fname, years) )
+                if key is not None:
+                    self.cache.save(key, self.data, self._cacheParams(years))
+                    self.cache.save(self._cacheKey(years, "masks"), self.masks.frame(), self._cacheParams(years))
+                if not optimiseFactor:
+                    # The csv is read by DataContainer
+                    self.data.to_csv(self._csvName(fname), index=False)
         
         # We're done with clustering, print some interesting messages
         time = datetime.now()-startTime
         print("Finished loading the data:", str(time)[:-7])
     
+    @property
+    def mapper(self):
+        """ The WeatherStationMapper, only loaded if the data is generated """
+        if self._mapper is None:
+            self._mapper = WeatherStationMapper(self.stationList, self.LatLon2Country, self.maxDistance)
+        return self._mapper
+    
     def __iter__(self):
         for item in self.stations:
             yield item
     
+    def sweep_factor(self, factors):
+        """
+        Count the extreme months for several threshold factors at once.
+        
+        The average and standard deviation of the previous years are the
+        ones computed when building the data, only the comparison is repeated
+        (as one broadcast over all factors). The months are collapsed in the
+        same way as in _collapse(), i.e. for each factor the result is the
+        same as rebuilding the data with this factor.
+        
+        If the data was taken from the cache (or built with keepStations=False)
+        the statistics are computed first, the stations are then read from
+        the station cache (see StationCache) or parsed again.
+        
+        Input:
+          factors (list):  The factors (in standard deviations) to evaluate
+        
+        Output:
+          result (DataFrame): The number of extreme months with the columns
+                              Factor, Country, Year and one per element
+        """
+        if self.statistics is None:
+            self._prepareSweep()
+        
+        stats   = self.statistics
+        factors = np.asarray(factors, dtype=np.float64).ravel()
+        flags   = stats.extreme(factors[:,None]) # factors x months
+        
+        keys    = ["Country", "Element", "Year", "Month"]
+        grouped = pd.DataFrame(flags.T.astype(np.int8), columns=factors)
+        grouped = pd.concat([stats.keys[keys], grouped], axis=1)
+        
+        # Take the average of the stations for each month and count the
+        # extreme months of each year
+        if self.weighted:
+            weight  = stats.keys["Station ID"].astype(str).map(self.mapper.weights).fillna(1.).values
+            grouped[list(factors)] = grouped[list(factors)].values * weight[:,None]
+            grouped["_Weight"]     = weight
+            grouped = grouped.groupby(keys, observed=True).sum()
+            grouped = grouped[list(factors)].div(grouped["_Weight"], axis=0).round()
+        else:
+            grouped = grouped.groupby(keys, observed=True)[list(factors)].mean().round()
+        grouped = grouped.groupby(keys[:-1], observed=True).sum()
+        
+        
+        # The layout of the pivot table of a single build (see
+        # CountryCounts.table()) with the factor in front: one column per
+        # element in alphabetical order, sorted by factor, country and year
+        result = grouped.rename_axis(columns="Factor").stack().unstack("Element")
+        result = result.reset_index()
+        result["Country"] = result["Country"].astype(str)
+        result = result[ result["Year"] >= 1980 ]
+        result = result.sort_values(["Factor", "Country", "Year"], kind="mergesort")
+        result = result[ ["Factor", "Country", "Year"] + sorted( set(result.columns) - {"Factor", "Country", "Year"} ) ]
+        result.columns.name = None
+        return result.reset_index(drop=True)
+    
+    def _prepareSweep(self):
+        """ Compute the statistics used by sweep_factor() """
+        if self.fname[-4:] == ".csv":
+            raise ValueError("sweep_factor() needs the archive, not the precompiled %s. " \
+                             "Pass the archive (e.g. ghcnd_gsn.tar.gz) as fname." %self.fname)
+        if self.shard is not None:
+            raise ValueError("sweep_factor() needs all stations, not only shard %d. " \
+                             "Use shard=None." %self.shard)
+        
+        print("Computing the statistics for the sweep..")
+        stations = self.stations or self._loadTar(self.fname, self.years)
+        self._classify( self._frame(stations) )
+    
+    def _cacheParams(self, years):
+        """ Everything the data depends on, see TableCache.key() """
+        return { "archive"        : self.cache.fileHash(self.fname)          ,\
+                 "stationList"    : self.cache.fileHash(self.stationList)    ,\
+                 "LatLon2Country" : self.cache.fileHash(self.LatLon2Country) ,\
+                 "years"          : [ int(year) for year in years ]          ,\
+                 "elements"       : self.elements                            ,\
+                 "factor"         : self.factor                              ,\
+                 "firstYear"      : self.firstYear                           ,\
+                 "lastYear"       : self.lastYear                            ,\
+                 "weighted"       : self.weighted                            ,\
+                 "maxDistance"    : self.maxDistance                         ,\
+                 "inventory"      : self.cache.fileHash(self.inventoryFile) if self.inventoryFile else None ,\
+                 "numShards"      : self.numShards                           ,\
+                 "version"        : CACHE_VERSION
+               }
+    
+    def _csvName(self, fname):
+        """ ghcnd_gsn.tar.gz -> ghcnd_gsn.csv """
+        folder, name = os.path.split(fname)
+        for extension in (".tar.gz", ".tgz", ".tar.bz2", ".tar"):
+            if name.endswith(extension):
+                name = name[:-len(extension)]
+                break
+        return os.path.join(folder, name + ".csv")
+    
+    def _cacheKey(self, years, table="data"):
+        if table == "data": # keep the keys of the existing caches
+            return self.cache.key( **self._cacheParams(years) )
+        return self.cache.key( table=table, **self._cacheParams(years) )
+    
     def _loadTar(self, fname, years):
         """
-        Extract the database into a temporary folder and read the data.
+        Read the stations directly from the database, i.e. from the tar
+        archive (e.g. ghcnd_gsn.tar.gz or ghcnd_all.tar.gz).
+        
+        The archive is read as a stream, one station file at a time. Nothing
+        is extracted to disk. With more than one process the station files
+        are parsed in a process pool while the archive is being read.
+        
+        Stations that did not change since the last build are taken from the
+        station cache (see StationCache) instead of being parsed again.
+        """
+        return list( self._iterStations(fname, years) )
+
+    def _iterStations(self, fname, years):
+        """
+        Yield the stations of the archive one at a time. (See _loadTar())
+        """
+        stationCache = None
+        if self.cache is not None:
+            stationCache = self._stationCache(years, self.shard)
+        
+        for stationID, arrays in self._parse(fname, years, stationCache):
+            country = self.mapper(stationID) # map the station to its country
+            yield WeatherStation(None, years, country, arrays)
+        
+        if stationCache is not None:
+            stationCache.close()
+            print("Parsed %d stations, %d unchanged stations were taken from the cache" \
+                  %(stationCache.misses, stationCache.hits))
+
+    def _parse(self, fname, years, stationCache=None):
+        """
+        Parse the station files of the archive, yields the stationID and the
+        arrays of each station (see parseStation()) in archive order.
+        
+        With more than one process the stations are parsed in a process pool.
+        The archive itself is read (and decompressed) in this process and the
+        raw station files are handed to the workers. The number of stations
+        in flight is bounded, i.e. the memory use does not depend on the size
+        of the archive.
+        
+        Only the elements that can meet firstYear and lastYear are parsed
+        (see _usable()), the others would be dropped in _classify() anyway.
         """
-        # Generate a temp folder in which the climate data will be extracted
-        tmpPath = tempfile.mkdtemp()
+        pool    = None
+        pending = deque() # (member, stationID, arrays or future)
+        skipped = 0
+        
+        def done(entry):
+            member, stationID, arrays = entry
+            if member is not None: # newly parsed
+                arrays = arrays if isinstance(arrays, tuple) else arrays.result()
+                if stationCache is not None:
+                    stationCache.save(member, arrays)
+            return stationID, arrays
         
-        stations = list()
         try:
-            # Extract the tar file
-            with tarfile.open(fname, 'r') as tar:
-                tar.extractall(tmpPath)
+            if self.processes > 1:
+                pool = ProcessPoolExecutor(max_workers=self.processes)
             
-            # Read the stations
-            for fname in os.listdir(tmpPath + "/ghcnd_gsn"):
-                stationID = os.path.split(fname)[1].split('.')[0]
-                country = self.mapper(stationID) # map the station to its country
-
-                stations.append(WeatherStation(tmpPath + "/ghcnd_gsn/" + fname, years, country))
+            for stationID, member, f in iterTar(fname, members=True):
+                if not self._inShard(stationID):
+                    continue
+                raw    = f.read()
+                arrays = stationCache.load(member, raw) if stationCache is not None else None
+                if arrays is not None:
+                    pending.append( (None, stationID, arrays) )
+                else:
+                    elements = self._usable(stationID, raw, years)
+                    if not elements:
+                        skipped += 1
+                        pending.append( (member, stationID, parseStation(b"", years, stationID, elements)) )
+                    elif pool is not None:
+                        pending.append( (member, stationID, pool.submit(_parseMember, (stationID, raw, years, elements))) )
+                    else:
+                        pending.append( (member, stationID, parseStation(raw, years, stationID, elements)) )
+                
+                if pool is None or len(pending) >= 4*self.processes:
+                    yield done( pending.popleft() )
+            while pending:
+                yield done( pending.popleft() )
+            if skipped:
+                print("Skipped %d stations without an element measuring from %d to %d" %(skipped, self.firstYear, self.lastYear))
         finally:
-            shutil.rmtree(tmpPath) # make sure the tmp folder is deleted
-        return stations
+            if pool is not None:
+                pool.shutdown()
+
+    def _usable(self, stationID, raw, years):
+        """
+        Get the elements of the station that can meet firstYear and lastYear
+        within the year range, i.e. that might be kept by _classify(). The
+        year spans are taken from the inventory or scanned from the raw
+        station file.
+        """
+        spans = self.inventory.get(stationID)
+        if spans is None:
+            spans = scanSpans(raw, years)
+        
+        usable = list()
+        for element in self.elements:
+            if element in spans:
+                first, last = spans[element]
+                if max(first, years[0]) <= self.firstYear and min(last, years[1]) >= self.lastYear:
+                    usable.append(element)
+        return usable
 
     def _combine(self, stations, optimiseFactor=False):
         """
@@ -117,324 +450,1048 @@ class WeatherData(object):
         are transformed into a severity index for each year. For each months
         the average of the measurements is taken and compared to the measurements
         of the previous months of the same station. If the average deviates by
-        more than 1.54 from standart deviations this months will be classified
+        more than 1.54 (self.factor) standart deviations this months will be classified
         as extreme. Each year is thus assigned a value between 0 and 12,
         depending on how many months of that year were identified as being
         extreme.
         """
-        data = pd.concat( [ station.data for station in stations ] )
+        data = self._frame(stations)
         data = self._collapse(data, optimiseFactor)
         return data
 
+    def _frame(self, stations):
+        """
+        Concatenate the arrays of all stations and create one DataFrame.
+        """
+        return monthlyFrame(stations)
+
     def _collapse(self, dataFrame, optimiseFactor=False):
         """
         Collapse the dataFrame. (See _combine())
         """
-        def df_entry(stationID, element, month, year, value, \
-                     thisYear, lastYearAvg, lastYearStd):
-            country = self.mapper(stationID)
-            return( { "Country"       : country   ,\
-                      "Element"       : element   ,\
-                      "Month"         : month     ,\
-                      "Year"          : year      ,\
-                      "Value"         : value     ,\
-                      "_ThisYear"     : thisYear  ,\
-                      "_LastYearsAvg" : lastYearAvg ,\
-                      "_LastYearsStd" : lastYearStd ,\
-                     }
-                   )
-        
-        def remove(column, dataFrame=None):
-            """
-            Remove the column from DataFrame if existent.
-            
-            Input:
-              column (str):          Column name to be removed
-              
-              dataFrame (DataFrame): DataFrame from which column shoudl be removed
-            """
-            try:
-                if dataFrame is None:
-                    del grouped[column]
-                else:
-                    del dataFrame[column]
-            except KeyError:
-                pass
-                
-        def getStatistics(subdf):
-            """
-            Classify each month to be either extreme or normal based on the
-            deviation from the average.            
-            """
-            # Sanity checks
-            stationID = subdf["Station ID"].unique()
-            assert( len(stationID) == 1 )
-            stationID = stationID[0]
-
-            newData = list()
-            # Do for each element
-            for element in ["PRCP", "SNOW", "SNWD", "TMAX", "TMIN", "AWND"]:
-                df = subdf[ subdf["Element"] == element ]
-                df = df.sort(columns=["Year"])
-                
-                # Only take stations that exist long enough and still are existent
-                if np.min(df["Year"]) > 1950 or np.max(df["Year"]) < 2013:
-                    continue
-                
-                # Check for each month if it is extreme
-                for month, group in df.groupby(["Month"]):
-                    years     = set(group["Year"])
-                    firstYear = np.min(list(years))
-                    for year in years:
-                        
-                        if year == firstYear: # ignore fist years
-                            newData.append( df_entry(stationID, element, month, year, 0, -9999, -9999, -9999) )
-                        else:
-                            lastYears = group[ group["Year"] <  year ]["Value"]
-                            thisYear  = group[ group["Year"] == year ]["Value"]
-
-                            thisYearAvg  = np.average(thisYear)
-                            lastYearsAvg = np.average(lastYears)
-                            lastYearsStd = np.std(lastYears)
-                            factor       = 1.54 # see noteboks for more info
-                            
-                            # Classify as extreme or not
-                            if thisYearAvg > lastYearsAvg + factor*lastYearsStd or \
-                               thisYearAvg < lastYearsAvg - factor*lastYearsStd:
-                                newData.append( df_entry(stationID, element, month, year, 1, thisYearAvg, lastYearsAvg, lastYearsStd) )
-                            else:
-                                newData.append( df_entry(stationID, element, month, year, 0, thisYearAvg, lastYearsAvg, lastYearsStd) )
-            
-            # Create a new DataFrame
-            newDataFrame = pd.DataFrame.from_dict(newData, orient="columns")
-            return newDataFrame
-                    
-        # End of functions definitions, group and apply
-        remove("Country", dataFrame)
-        grouped = dataFrame.groupby(["Station ID"]).apply(getStatistics)
-        grouped.reset_index(inplace=True)
+        grouped = self._classify(dataFrame)
         
         # If in manual optimise step omit the collapsing of the DataFrame
         if optimiseFactor:
             return grouped
         
-        # Take the average of the stations for each month
-        remove("level_1")
-        remove("Station ID")
-        grouped = grouped.groupby(["Country","Element","Year","Month"]).agg( lambda x: np.round(np.average(x)) )
-        grouped.reset_index(inplace=True)
-        
-        # Now we have a table containing a flag (i.e. 1) if an extreme weather
-        # event occured.
-        remove("level_1")
-        remove("Month")
-        grouped = grouped.groupby(["Country","Element","Year"]).agg(sum)
-        grouped.reset_index(inplace=True)
-        
-        # Pivot the table so that the "Element" entries are columns and 
-        # remove the early weather events.
-        result = grouped.pivot_table(index=["Country","Year"], columns="Element", values="Value")
-        result.reset_index(inplace=True)
-        result = result[ result["Year"] >= 1980 ]
+        return self._finish( self._fold(grouped) )
+
+    def _reduce(self, stations):
+        """
+        Collapse the stations without keeping them all in memory.
+        
+        The stations are classified in chunks of self.chunksize stations and
+        each chunk is folded into the monthly counts of each country (see
+        _fold()) before the next chunk is read. Gives the same result as
+        _combine().
+        """
+        return self._finish( self._count(stations) )
+
+    def _count(self, stations):
+        """
+        Classify the stations in chunks and fold them into the monthly
+        counts of each country, see _reduce().
+        """
+        counts = CountryCounts(self.elements, self.years)
+        chunk  = list()
+        for station in stations:
+            chunk.append(station)
+            if len(chunk) >= self.chunksize:
+                counts = self._fold( self._classify(monthlyFrame(chunk)), counts )
+                chunk  = list()
+        if chunk:
+            counts = self._fold( self._classify(monthlyFrame(chunk)), counts )
+        
+        self.statistics = None # these would only be the ones of the last chunk
+        return counts
+
+    def _inShard(self, stationID):
+        """ True if the station belongs to self.shard (see __init__) """
+        return self.shard is None or zlib.crc32( stationID.encode() ) % self.numShards == self.shard
+
+    def _stationCache(self, years, shard=None):
+        """
+        The StationCache of the build. The shards may run at the same time,
+        each of them keeps its own index (merged in _mergeShards()).
+        """
+        index = "index" if shard is None else self._stationIndex(shard)
+        return StationCache(os.path.join(self.cache.folder, "stations"), years, self.elements, \
+                            [self.firstYear, self.lastYear], index)
+    
+    def _stationIndex(self, shard):
+        return "index.shard-%d-of-%d" %(shard, self.numShards)
+    
+    def _shardName(self, shard):
+        return os.path.join(self.shardFolder, "%s.shard-%d-of-%d.npz" \
+                            %(os.path.split(self._csvName(self.fname))[1][:-4], shard, self.numShards))
+
+    def _shardParams(self, years):
+        """ Everything the counts of a shard depend on """
+        stat = os.stat(self.fname)
+        return { "archive"     : [ os.path.split(self.fname)[1], stat.st_size, stat.st_mtime ] ,\
+                 "years"       : [ int(year) for year in years ] ,\
+                 "elements"    : self.elements                   ,\
+                 "factor"      : self.factor                     ,\
+                 "firstYear"   : self.firstYear                  ,\
+                 "lastYear"    : self.lastYear                   ,\
+                 "weighted"    : self.weighted                   ,\
+                 "maxDistance" : self.maxDistance                ,\
+                 "inventory"   : os.path.split(self.inventoryFile)[1] if self.inventoryFile else None ,\
+                 "numShards"   : self.numShards                  ,\
+                 "version"     : CACHE_VERSION
+               }
+
+    def _saveShard(self, counts, years):
+        """ Write the monthly counts of self.shard to the shard folder """
+        if not os.path.isdir(self.shardFolder):
+            os.makedirs(self.shardFolder)
+        fname = self._shardName(self.shard)
+        with open(fname + ".tmp", 'wb') as f:
+            counts.save(f, self._shardParams(years))
+        os.replace(fname + ".tmp", fname) # other machines only see complete files
+        print("Wrote shard %d of %d to %s" %(self.shard, self.numShards, fname))
+
+    def _mergeShards(self, years):
+        """
+        Add up the monthly counts of all shards. The counts are the number
+        of (extreme) stations, i.e. the sum does not depend on the order and
+        the result is the same as building all stations at once. (With
+        weighted=True the counts are sums of weights, which can differ in the
+        last digits.)
+        """
+        counts = CountryCounts(self.elements, self.years)
+        params = self._shardParams(years)
+        for shard in range(self.numShards):
+            fname = self._shardName(shard)
+            if not os.path.isfile(fname):
+                raise IOError("Shard %d of %d is missing: %s" %(shard, self.numShards, fname))
+            if counts.merge(fname) != params:
+                raise IOError("Shard %d of %d was built with different parameters: %s" %(shard, self.numShards, fname))
+        
+        # Keep the stations parsed by the shards (on this machine) for later builds
+        if self.cache is not None:
+            self._stationCache(years).merge( [ self._stationIndex(shard) for shard in range(self.numShards) ] )
+        return counts
+
+    def _fold(self, grouped, counts=None):
+        """
+        Add the classified months (see _classify()) to the monthly counts of
+        each country (see CountryCounts), counts holds the previous chunks.
+        """
+        if counts is None:
+            counts = CountryCounts(self.elements, self.years)
+        counts.add(grouped, self.mapper.weights if self.weighted else None)
+        return counts
 
+    def _finish(self, counts):
+        """
+        Create the result table from the monthly counts (see _fold()) and
+        remove the early weather events. The extreme months are kept in
+        self.masks.
+        """
+        self.masks = counts.masks().between(1980)
+        result = counts.table()
+        result = result[ result["Year"] >= 1980 ].reset_index(drop=True)
         return result
 
+    def _classify(self, dataFrame, factor=None):
+        """
+        Classify each month to be either extreme or normal based on the
+        deviation from the average of the same month in the previous years.
+        
+        The statistics of the previous years are computed for all stations at
+        once (see ExpandingStatistics). The first year of each station,
+        element and month is normal and its statistics are -9999.
+        
+        Input:
+          dataFrame (DataFrame): Monthly averages of all stations (see _frame())
+          
+          factor (float):        Number of standard deviations a month must
+                                 deviate to be extreme, defaults to self.factor
+        """
+        if factor is None:
+            factor = self.factor
+        data = dataFrame[ dataFrame["Element"].isin(self.elements) ]
+        
+        # Only take stations that exist long enough and still are existent
+        years = data.groupby(["Station ID", "Element"], observed=True)["Year"]
+        data  = data[ (years.transform("min") <= self.firstYear) & (years.transform("max") >= self.lastYear) ]
+        
+        # The country was looked up once per station when loading. The
+        # statistics are kept for sweep_factor()
+        stats = ExpandingStatistics(data, ["Station ID", "Element", "Month"], columns=["Country"])
+        flag  = stats.extreme(factor)
+        self.statistics = stats
+        
+        grouped = stats.keys
+        grouped["Value"]         = flag.astype(np.int8)
+        grouped["_ThisYear"]     = np.where(stats.first, -9999, stats.this)
+        grouped["_LastYearsAvg"] = np.where(stats.first, -9999, stats.avg)
+        grouped["_LastYearsStd"] = np.where(stats.first, -9999, stats.std)
+        return grouped
 
-class LatLon2Country(dict):
+
+class ExpandingStatistics(object):
     
-    def __init__(self, fname, *args):
+    def __init__(self, data, keys, year="Year", value="Value", columns=()):
+        """
+        Average and standard deviation of all previous years, computed for
+        many series (e.g. station, element and month) at once.
+        
+        The data is sorted by series and year and the statistics are taken
+        from cumulative sums over the (sorted) years, i.e. each series is
+        passed only once. The values are shifted by the first value of their
+        series to keep the sums small.
+        
+        Input:
+          data (DataFrame):  Contains the keys, the year and the value columns
+          
+          keys (list):       The columns identifying one series
+          
+          year (str):        The year column
+          
+          value (str):       The value column
+          
+          columns (list):    Further columns that are constant in each series
+                             and should be kept in self.keys
+        
+        Attributes (one entry per series and year):
+          keys (DataFrame):  The keys, the year and the columns
+          
+          this (np.array):   Average of this year
+          
+          avg, std (np.array): Average and standard deviation of the previous years
+          
+          first (np.array):  True for the first year of each series
+        """
+        data   = data.sort_values(keys + [year], kind="mergesort")
+        series = data.groupby(keys, sort=False, observed=True).ngroup().values
+        years  = data[year].values
+        values = data[value].values.astype(np.float64)
+        
+        # The first row of each series and of each year within the series
+        newSeries = np.ones(len(values), dtype=bool)
+        newSeries[1:] = series[1:] != series[:-1]
+        newYear = newSeries.copy()
+        newYear[1:] |= years[1:] != years[:-1]
+        
+        self.values = values
+        self.start  = np.flatnonzero(newYear)
+        self.count  = np.diff(np.append(self.start, len(values)))
+        self.series = series[self.start]
+        self.origin = np.flatnonzero(newSeries)[self.series] # first row of the series
+        
+        shift  = values[self.origin]
+        x      = values - np.repeat(shift, self.count)
+        sums   = pd.DataFrame( {"n" : self.count.astype(np.float64)       ,\
+                                "s1": np.add.reduceat(x,   self.start)    ,\
+                                "s2": np.add.reduceat(x*x, self.start)    ,\
+                                } )
+        # Sum over the previous years only, i.e. shift the cumulative sums
+        prior  = sums.groupby(self.series).cumsum().groupby(self.series).shift(1, fill_value=0)
+        
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean     = prior["s1"].values / prior["n"].values
+            self.avg = mean + shift
+            self.std = np.sqrt( np.maximum(prior["s2"].values / prior["n"].values - mean**2, 0) )
+        self.this  = np.add.reduceat(values, self.start) / self.count
+        self.first = prior["n"].values == 0
+        
+        self.keys  = data.iloc[self.start][keys + [year] + list(columns)].reset_index(drop=True)
+    
+    def __len__(self):
+        return len(self.start)
+    
+    def extreme(self, factor):
+        """
+        True where this year deviates by more than factor standard deviations
+        from the average of the previous years. Never true for the first year.
+        
+        factor can be an array, e.g. of shape (factors, 1) to get the result
+        for several factors at once (shape (factors, len(self))).
+        
+        Cases too close to the threshold to be decided reliably from the
+        cumulative sums are recomputed from the values, i.e. the result is
+        the same as with np.average and np.std over the previous years.
+        """
+        factor = np.asarray(factor, dtype=np.float64)
+        flag   = ( (self.this > self.avg + factor*self.std) | \
+                   (self.this < self.avg - factor*self.std) ) & ~self.first
+        
+        margin  = np.abs(self.this - self.avg) - factor*self.std
+        scale   = np.abs(self.this) + np.abs(self.avg) + factor*self.std
+        factors = np.broadcast_to(factor, flag.shape)
+        for index in zip( *np.nonzero( ~self.first & (np.abs(margin) <= 1e-6*scale) ) ):
+            i, factor = index[-1], factors[index]
+            lastYears = self.values[ self.origin[i]:self.start[i] ]
+            thisYear  = self.values[ self.start[i]:self.start[i]+self.count[i] ]
+            
+            thisYearAvg  = np.average(thisYear)
+            lastYearsAvg = np.average(lastYears)
+            lastYearsStd = np.std(lastYears)
+            flag[index] = thisYearAvg > lastYearsAvg + factor*lastYearsStd or \
+                      thisYearAvg < lastYearsAvg - factor*lastYearsStd
+        return flag
+
+
+class CountryCounts(object):
+    
+    def __init__(self, elements, years):
+        """
+        The classified months (see WeatherData._classify()) counted for each
+        country, element and month (slot) of the year range.
+        
+        The stations are summed per country with a sparse membership matrix
+        W (countries x stations), i.e. for each element
+        
+            extreme  += W @ F    F: stations x slots, 1 if extreme
+            stations += W @ P    P: stations x slots, 1 if classified
+        
+        The average of the stations of a country is extreme/stations. The
+        entries of W are the weights of the stations (1 by default).
+        
+        Input:
+          elements (list):  The elements
+          
+          years (list):     List of two integers specifing the year range
+        """
+        self.elements  = list(elements)
+        self.firstYear = int(years[0])
+        self.slots     = (int(years[1]) - self.firstYear + 1) * 12
+        
+        self.countries = list()
+        self.index     = dict() # country -> row
+        self.extreme   = np.zeros( (len(self.elements), 0, self.slots) )
+        self.stations  = np.zeros( (len(self.elements), 0, self.slots) )
+    
+    def add(self, grouped, weights=None):
+        """
+        Add the classified months of some stations.
+        
+        Input:
+          grouped (DataFrame): Output of WeatherData._classify()
+          
+          weights (dict):      Weight of each station ID, 1 if missing
+        """
+        grouped = grouped[ pd.notnull(grouped["Country"]) ]
+        
+        station, stationIDs = pd.factorize( grouped["Station ID"] )
+        country = self._rows( grouped["Country"].values )
+        
+        # The membership matrix, each station belongs to one country
+        member = np.zeros(len(stationIDs), dtype=np.int64)
+        member[station] = country
+        weight = np.ones(len(stationIDs))
+        if weights is not None:
+            weight = np.array( [ weights.get(stationID, 1.) for stationID in stationIDs ], dtype=np.float64 )
+        W = sparse.csr_matrix( (weight, (member, np.arange(len(stationIDs)))), shape=(len(self.countries), len(stationIDs)) )
+        
+        slot    = (grouped["Year"].values.astype(np.int64) - self.firstYear) * 12 + grouped["Month"].values.astype(np.int64) - 1
+        element = np.asarray(grouped["Element"].astype(str).values)
+        flag    = grouped["Value"].values.astype(np.float64)
+        shape   = (len(stationIDs), self.slots)
+        for i, name in enumerate(self.elements):
+            rows = element == name
+            if not np.any(rows):
+                continue
+            F = sparse.csr_matrix( (flag[rows],             (station[rows], slot[rows])), shape=shape )
+            P = sparse.csr_matrix( (np.ones(np.sum(rows)), (station[rows], slot[rows])), shape=shape )
+            self.extreme[i]  += (W @ F).toarray()
+            self.stations[i] += (W @ P).toarray()
+    
+    def table(self):
+        """
+        The number of extreme months of each country, year and element.
+        
+        A month of a country is extreme if most of its stations (by weight)
+        were extreme, i.e. the rounded average is 1.
+        
+        Output:
+          result (DataFrame): Columns Country, Year and one per element
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            monthly = np.round(self.extreme / self.stations)
+        present = self.stations > 0
+        
+        # Sum the months of each year, years without any month are NaN
+        shape   = monthly.shape[:2] + (self.slots // 12, 12)
+        yearly  = np.where(present, monthly, 0).reshape(shape).sum(axis=3)
+        present = present.reshape(shape).any(axis=3)
+        yearly[~present] = np.nan
+        
+        country, year = np.nonzero( present.any(axis=0) )
+        order  = np.lexsort( (year, np.asarray(self.countries, dtype=object)[country]) )
+        country, year = country[order], year[order]
+        
+        result = pd.DataFrame( {"Country": np.asarray(self.countries, dtype=object)[country] ,\
+                                "Year"   : (year + self.firstYear).astype(np.int16)         ,\
+                               }, columns=["Country", "Year"] )
+        for i, name in enumerate(self.elements):
+            if present[i].any():
+                result[name] = yearly[i][country, year]
+        return result
+    
+    def masks(self):
+        """
+        Which months of each country, year and element were extreme (see
+        table() and MonthMasks). Only the years with data are kept.
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            monthly = np.round(self.extreme / self.stations)
+        present = self.stations > 0
+        
+        shape   = monthly.shape[:2] + (self.slots // 12, 12)
+        extreme = ( (monthly == 1) & present ).reshape(shape)
+        masks   = ( extreme * (1 << np.arange(12)) ).sum(axis=3).astype(np.uint16)
+        masks[ ~present.reshape(shape).any(axis=3) ] = NO_DATA
+        
+        order = np.argsort( np.asarray(self.countries, dtype=object) ) if self.countries else np.zeros(0, dtype=int)
+        years = np.flatnonzero( (masks != NO_DATA).any(axis=(0,1)) )
+        masks = masks.transpose(1, 2, 0)[order][:, years] # countries x years x elements
+        return MonthMasks( [ self.countries[i] for i in order ], years + self.firstYear, self.elements, masks )
+    
+    def save(self, f, params=None):
+        """
+        Write the counts to the file (object) f. Only the non-zero entries
+        are kept, params are stored for reference (see merge()).
+        """
+        element, country, slot = np.nonzero(self.stations)
+        np.savez(f, countries = np.asarray(self.countries, dtype=str)                 ,\
+                    elements  = np.asarray(self.elements,  dtype=str)                 ,\
+                    years     = np.array([self.firstYear, self.slots // 12], dtype=np.int64) ,\
+                    index     = np.column_stack( (element, country, slot) ).astype(np.int64) ,\
+                    extreme   = self.extreme[element, country, slot]                  ,\
+                    stations  = self.stations[element, country, slot]                 ,\
+                    params    = np.str_( json.dumps(params, sort_keys=True) )
+                )
+    
+    def merge(self, fname):
+        """
+        Add the counts written with save() to fname. Returns the params
+        stored with the counts.
+        """
+        with np.load(fname, allow_pickle=False) as f:
+            assert( list(f["elements"]) == self.elements )
+            assert( list(f["years"]) == [self.firstYear, self.slots // 12] )
+            
+            rows = self._rows( f["countries"].astype(object) ) if len(f["countries"]) else np.zeros(0, dtype=np.int64)
+            element, country, slot = f["index"].T
+            self.extreme[element, rows[country], slot]  += f["extreme"]
+            self.stations[element, rows[country], slot] += f["stations"]
+            return json.loads( str(f["params"]) )
+    
+    def _rows(self, countries):
+        """ The row of each country, new countries are appended """
+        codes, names = pd.factorize(countries)
+        rows = np.empty(len(names), dtype=np.int64)
+        for i, name in enumerate(names):
+            if name not in self.index:
+                self.index[name] = len(self.countries)
+                self.countries.append(name)
+            rows[i] = self.index[name]
+        
+        grow = len(self.countries) - self.extreme.shape[1]
+        if grow > 0:
+            self.extreme  = np.concatenate( (self.extreme,  np.zeros((len(self.elements), grow, self.slots))), axis=1 )
+            self.stations = np.concatenate( (self.stations, np.zeros((len(self.elements), grow, self.slots))), axis=1 )
+        return rows[codes]
+
+
+def iterTar(fname, members=False):
+    """
+    Iterate over the station files (.dly) in the tar archive fname.
+    
+    The archive is opened in stream mode, i.e. it is read front to back and
+    only the current member is held in memory. Yields the station ID and
+    the file object of each member; the file object must be read before
+    the next member is requested. With members=True the TarInfo of the
+    member is yielded as well, i.e. (stationID, member, file object).
+    """
+    with tarfile.open(fname, 'r|*') as tar:
+        for member in tar:
+            if member.isfile() and member.name.endswith(".dly"):
+                stationID = os.path.split(member.name)[1].split('.')[0]
+                if members:
+                    yield stationID, member, tar.extractfile(member)
+                else:
+                    yield stationID, tar.extractfile(member)
+            tar.members = [] # do not keep the member list for large archives
+
+
+class StationCache(object):
+    
+    def __init__(self, folder, years, elements, span=None, index="index"):
+        """
+        Keep the parsed arrays of each station (see parseStation()) between
+        builds, i.e. only new or changed stations need to be parsed when a
+        new version of the archive is published.
+        
+        A station is unchanged if the tar member has the same name, size and
+        modification time. If only the modification time differs the content
+        is compared by its checksum (crc32). The arrays are kept per member
+        (full path in the archive) and parameters, i.e. builds for other
+        years, elements or span have their own entries and files.
+        
+        Input:
+          folder (str):    The cache folder, created if needed
+          
+          years (list):    The year range of the parsed arrays
+          
+          elements (list): The elements of the parsed arrays
+          
+          span (list):     The firstYear and lastYear the parsed elements were
+                           selected with (see WeatherData._usable())
+          
+          index (str):     Name of the index file. Builds running at the same
+                           time (e.g. the shards of WeatherData) must use
+                           different names. Besides its own index, the cache
+                           reads the main index ("index") but only writes its
+                           own one, see merge().
+        """
+        self.folder   = folder
+        self.params   = { "years"    : [ int(year) for year in years ] ,\
+                          "elements" : list(elements)                  ,\
+                          "span"     : None if span is None else [ int(year) for year in span ] ,\
+                          "version"  : CACHE_VERSION
+                        }
+        self.key      = hashlib.sha1( json.dumps(self.params, sort_keys=True).encode("utf-8") ).hexdigest()[:16]
+        self.hits     = 0
+        self.misses   = 0
+        
+        self.fnameIndex = os.path.join(folder, index + ".json")
+        self.main       = index == "index"
+        self.index      = self._loadIndex( os.path.join(folder, "index.json") )
+        if not self.main:
+            self.index.update( self._loadIndex(self.fnameIndex) )
+        self.checksums  = dict() # of the members loaded in this run
+    
+    def load(self, member, raw):
+        """
+        Get the arrays of the tar member, None if it is new or changed.
+        
+        Input:
+          member (TarInfo):  The tar member of the station file
+          
+          raw (bytes):       The content of the member
+        """
+        entry    = self.index.get( self._entry(member.name) )
+        checksum = zlib.crc32(raw)
+        self.checksums[member.name] = checksum
+        
+        if entry is None or entry["params"] != self.params or entry["size"] != member.size or \
+           ( entry["mtime"] != member.mtime and entry["crc32"] != checksum ):
+            self.misses += 1
+            return None
+        
+        try:
+            with np.load(os.path.join(self.folder, entry["file"]), allow_pickle=False) as f:
+                arrays = ( str(f["stationID"]) or None, f["year"], f["month"], f["element"], f["value"] )
+        except (IOError, OSError, KeyError, ValueError):
+            self.misses += 1
+            return None
+        
+        entry["mtime"] = member.mtime
+        self.hits += 1
+        return arrays
+    
+    def save(self, member, arrays):
+        """ Store the arrays parsed from the tar member """
+        # One folder per parameters, the file name is unique for the full
+        # path of the member (the same station may be in several folders)
+        fname = os.path.join( self.key, "%s.%s.npz" %(os.path.split(member.name)[1], \
+                              hashlib.sha1( member.name.encode("utf-8") ).hexdigest()[:8]) )
+        if not os.path.isdir( os.path.join(self.folder, self.key) ):
+            os.makedirs( os.path.join(self.folder, self.key), exist_ok=True )
+        
+        stationID, year, month, element, value = arrays
+        with open(os.path.join(self.folder, fname), 'wb') as f:
+            np.savez(f, stationID=np.str_(stationID or ""), year=year, month=month, element=element, value=value)
+        
+        entry = { "file"   : fname                                 ,\
+                  "size"   : member.size                           ,\
+                  "mtime"  : member.mtime                          ,\
+                  "crc32"  : self.checksums.get(member.name, None) ,\
+                  "params" : self.params
+                }
+        self.index[ self._entry(member.name) ] = entry
+    
+    def close(self):
+        """
+        Write the index, must be called once all stations were handled. An
+        index other than the main one only keeps the stations of this run.
+        """
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder, exist_ok=True)
+        index = self.index
+        if not self.main:
+            entries = set( self._entry(name) for name in self.checksums )
+            index   = dict( (name, entry) for name, entry in index.items() if name in entries )
+        
+        temp = "%s.%d.tmp" %(self.fnameIndex, os.getpid())
+        with open(temp, 'w') as f:
+            json.dump(index, f)
+        os.replace(temp, self.fnameIndex)
+    
+    def merge(self, indexes):
+        """
+        Add the entries of other indexes (e.g. of the shards) to this index,
+        write it and remove the other index files.
+        
+        Input:
+          indexes (list):  The names of the indexes (see __init__)
+        """
+        fnames = [ os.path.join(self.folder, name + ".json") for name in indexes ]
+        fnames = [ fname for fname in fnames if os.path.isfile(fname) and fname != self.fnameIndex ]
+        for fname in fnames:
+            self.index.update( self._loadIndex(fname) )
+        self.close()
+        for fname in fnames:
+            os.remove(fname)
+    
+    def _entry(self, name):
+        """ The index entry of the member name for self.params """
+        return "%s:%s" %(self.key, name)
+    
+    def _loadIndex(self, fname):
+        if not os.path.isfile(fname):
+            return dict()
+        with open(fname, 'r') as f:
+            return json.load(f)
+
+
+class LatLon2Country(object):
+    
+    def __init__(self, fname, maxDistance=5.):
         """
         Map latitude and longitude information of the weather stations to
         their country of origin.
         
-        It is a dictionary that loads the values upon initialisation.
+        The known locations are kept in a KD-tree and each query is resolved
+        to the country of the nearest known location, as long as it is not
+        further away than maxDistance. The locations are read from the csv
+        file once and kept in a binary copy (.npz) next to it.
+        
+        Input:
+          fname (str):         Location of LatLon2Country.csv
+          
+          maxDistance (float): Maximal distance in km to the nearest known
+                               location
         """
-        super(LatLon2Country, self).__init__(args)
+        self.maxDistance = maxDistance
         
-        self._loadData(fname)
-
+        self.country, self.lat, self.lon = self._loadData(fname)
+        self.tree = cKDTree( self._unitVector(self.lat, self.lon) )
+        self._grid = None # see grid
+    
+    def __len__(self):
+        return len(self.country)
+    
+    def __getitem__(self, latLon):
+        """ Country of the (lat, lon) pair. Raises KeyError if there is none. """
+        country = self.query( [float(latLon[0])], [float(latLon[1])] )[0]
+        if pd.isnull(country):
+            raise KeyError(latLon)
+        return country
+    
+    def query(self, lat, lon, maxDistance=None):
+        """
+        Get the countries of many locations at once.
+        
+        Input:
+          lat, lon (np.array): Latitudes and longitudes in degrees
+          
+          maxDistance (float): Maximal distance in km, defaults to the one
+                               given on initialisation
+        
+        Output:
+          country (np.array):  The countries, NaN where no known location is
+                               close enough
+        """
+        if maxDistance is None:
+            maxDistance = self.maxDistance
+        
+        # The tree works on the unit sphere, i.e. convert the distance on the
+        # surface into the straight line (chord) distance.
+        chord = 2 * np.sin( min(maxDistance / EARTH_RADIUS, np.pi) / 2 )
+        
+        points = self._unitVector( np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64) )
+        _, idx = self.tree.query(points, k=1, distance_upper_bound=chord*(1+1e-9))
+        
+        found   = idx < len(self.country)
+        country = np.full(len(idx), np.nan, dtype=object)
+        country[found] = self.country[ idx[found] ]
+        return country
+    
+    @property
+    def grid(self):
+        """
+        The cells of a regular latitude, longitude grid (GRID_SIZE degrees)
+        that belong to a country, given as the latitude, longitude (of the
+        centre) and country of each cell. A cell belongs to the country of
+        the nearest known location if it is not further away than
+        GRID_DISTANCE, i.e. cells in the open sea belong to no country.
+        """
+        if self._grid is None:
+            lat = np.arange(-90  + GRID_SIZE / 2., 90,  GRID_SIZE)
+            lon = np.arange(-180 + GRID_SIZE / 2., 180, GRID_SIZE)
+            lat, lon = [ x.ravel() for x in np.meshgrid(lat, lon, indexing="ij") ]
+            country  = self.query(lat, lon, GRID_DISTANCE)
+            known    = pd.notnull(country)
+            self._grid = ( lat[known], lon[known], country[known] )
+        return self._grid
+    
+    def _unitVector(self, lat, lon):
+        lat = np.radians(lat)
+        lon = np.radians(lon)
+        return np.column_stack( (np.cos(lat)*np.cos(lon), np.cos(lat)*np.sin(lon), np.sin(lat)) )
+    
     def _loadData(self, fname):
+        """
+        Read the locations from the binary copy if it is up to date,
+        otherwise from the csv file (and write the binary copy).
+        """
+        fnameCache = os.path.splitext(fname)[0] + ".npz"
+        if os.path.isfile(fnameCache) and os.path.getmtime(fnameCache) >= os.path.getmtime(fname):
+            with np.load(fnameCache, allow_pickle=False) as cache:
+                return cache["country"].astype(str).astype(object), cache["lat"], cache["lon"]
+        
         with open(fname, 'r') as f:
             header = f.readline()
-            assert( header.strip() == "Country,Latitude,Longitude" )
-            for l in f:
-                line = l.strip().split(',')
-                country = line[0]
-                lat     = line[1]
-                lon     = line[2]
+        assert( header.strip() == "Country,Latitude,Longitude" )
+        
+        data    = pd.read_csv(fname, dtype={"Country": str, "Latitude": np.float64, "Longitude": np.float64})
+        country = data["Country"].fillna("").to_numpy(dtype=str)
+        lat     = data["Latitude"].values
+        lon     = data["Longitude"].values
+        try:
+            with open(fnameCache, 'wb') as f:
+                np.savez(f, country=country, lat=lat, lon=lon)
+        except (IOError, OSError):
+            pass # the binary copy is optional
+        return country.astype(object), lat, lon
+    
+    def weights(self, country, lat, lon):
+        """
+        Get the share of the area of its country each station covers.
+        
+        The area is counted on a regular grid (see grid), the area of a
+        cell is proportional to the cosine of its latitude. Each cell of a
+        country is assigned to the nearest station of the country (a Voronoi
+        partition of the country on the grid). Every station covers at least
+        the cell it is in, i.e. all weights are positive. The weights of the
+        stations of a country sum up to one.
+        
+        Input:
+          country (np.array):  The country of each station (see query())
+          
+          lat, lon (np.array): Latitudes and longitudes of the stations
+        
+        Output:
+          weight (np.array):   The weight of each station, NaN if the country
+                               is unknown
+        """
+        lat    = np.asarray(lat, dtype=np.float64)
+        lon    = np.asarray(lon, dtype=np.float64)
+        weight = np.full(len(lat), np.nan)
+        
+        cellLat, cellLon, cellCountry = self.grid
+        area = np.cos( np.radians(cellLat) )
+        
+        # The latitude of the centre of the cell each station is in
+        ownLat  = ( np.floor( (np.clip(lat, -90, 90 - 1e-9) + 90) / GRID_SIZE ) + 0.5 ) * GRID_SIZE - 90
+        ownArea = np.cos( np.radians(ownLat) )
+        
+        known    = np.flatnonzero( pd.notnull(country) )
+        stations = pd.Series(known).groupby( np.asarray(country, dtype=object)[known] ).indices
+        cells    = pd.Series( np.arange(len(cellCountry)) ).groupby( cellCountry ).indices
+        for name, station in stations.items():
+            station = known[station]
+            cell    = cells.get(name, np.zeros(0, dtype=int))
             
-                self.__setitem__((lat,lon), country)
+            share = np.zeros(len(station))
+            if len(cell) > 0:
+                tree = cKDTree( self._unitVector(lat[station], lon[station]) )
+                _, nearest = tree.query( self._unitVector(cellLat[cell], cellLon[cell]) )
+                share = np.bincount(nearest, weights=area[cell], minlength=len(station))
+            share = np.maximum(share, ownArea[station])
+            weight[station] = share / share.sum()
+        return weight
+
+
+# Mean earth radius in km
+EARTH_RADIUS = 6371.0088
+
+# The grid of the station weights (see LatLon2Country.weights()): the size
+# of the cells in degrees and the maximal distance in km of a cell to the
+# nearest known location of its country
+GRID_SIZE     = 0.5
+GRID_DISTANCE = 100.
 
 
 class WeatherStation(object):
     
-    def __init__(self, fname, years, country):
+    def __init__(self, fname, years, country, arrays=None):
         """
         Read the climate information from weather stations published by NOAA
         
         See: ftp://ftp.ncdc.noaa.gov/pub/data/ghcn/daily/
         
-        
+        The monthly averages are kept as arrays (see parseStation()), the
+        DataFrame is only created when self.data is accessed. If arrays is
+        given (e.g. parsed in a worker process) fname is not read.
         """
         
         self.stationID  = None
         self.years      = years
         self.country    = country
         
-        self.data       = self._load(fname, years)
+        if arrays is None:
+            arrays = self._load(fname, years)
+        self.stationID, self.year, self.month, self.element, self.value = arrays
     
     def __repr__(self):
         return "WeatherStation Object: Station: %r; Country: %r; Years: %r" %(self.stationID, self.country, self.years)
 
+    def __len__(self):
+        return len(self.value)
+
+    @property
+    def data(self):
+        """ The monthly averages of the station as pandas DataFrame """
+        return monthlyFrame([self, ])
+
     def _load(self, fname, years):
         """
-        Read the climate data from the NOAA and store it in a pandas DataFrame
-        """
-        yearRange = range(years[0],years[1]+1)
+        Read the climate data from the NOAA .dly file
         
-        count = 0
-        data = list()
-        with open(fname, 'r') as f:
-            for line in f:
-                self.stationID, year, month, element, value = self._readline(line)
-                
-                # Check if we want to keep the reading
-                if year not in yearRange:
-                    continue
-                if element not in ["PRCP", "SNOW", "SNWD", "TMAX", "TMIN", "AWND"]:
-                    continue
-                if value is None:
-                    count += 1
-                    continue
-   
-                data.append( {"Station ID": self.stationID ,\
-                              "Country"   : self.country   ,\
-                              "Year"      : year           ,\
-                              "Month"     : month          ,\
-                              "Element"   : element        ,\
-                              "Value"     : float(value)   ,\
-                              }
-                            )
-        
-        if len(data) == 0:
-            data.append( {"Station ID": self.stationID ,\
-                          "Country"   : self.country   ,\
-                          "Year"      : year           ,\
-                          "Month"     : month          ,\
-                          "Element"   : element        ,\
-                          "Value"     : np.NaN   ,\
-                          }
+        fname can either be the location of the .dly file or an open file
+        object (e.g. a member of the tar archive).
+        """
+        if isinstance(fname, str):
+            with open(fname, 'rb') as f:
+                return parseStation(f.read(), years)
+        else:
+            return parseStation(fname.read(), years)
+
+
+def parseStation(raw, years, stationID=None, elements=ELEMENTS):
+    """
+    Parse the content of one .dly file into compact per-station arrays.
+    
+    This is a plain function (and returns plain numpy arrays) so that it
+    can be run in worker processes. Only the monthly averages of the
+    elements within the year range are kept.
+    
+    Input:
+      raw (bytes):      Content of the .dly file
+      
+      years (list):     List of two integers specifing the year range
+      
+      stationID (str):  Used if the file is empty
+      
+      elements (list):  The elements to keep
+    
+    Output:
+      stationID (str), year (int16), month (int8), element (S4), value (float32)
+    """
+    records = readDly(raw, elements)
+    if len(records) > 0:
+        stationID = records["station"][0].decode()
+    
+    # Check which readings we want to keep
+    year, month, value = monthlyAverage(records)
+    keep = (year >= years[0]) & (year <= years[1]) & \
+           np.isin(records["element"], [ e.encode() for e in elements ]) & pd.notnull(value)
+    
+    return stationID, year[keep], month[keep], records["element"][keep], value[keep].astype(np.float32)
+
+
+def monthlyFrame(stations):
+    """
+    Create one DataFrame from the arrays of the stations (see parseStation()).
+    
+    The columns are written once from the concatenated arrays. Station ID,
+    Country and Element are categorical, Year is int16, Month int8 and the
+    Value float32.
+    """
+    length = [ len(station) for station in stations ]
+    
+    stationID = pd.factorize(np.array([ station.stationID for station in stations ], dtype=object))
+    country   = pd.factorize(np.array([ station.country   for station in stations ], dtype=object))
+    
+    element    = np.concatenate([ station.element for station in stations ])
+    codes      = np.full(len(element), -1, dtype=np.int8)
+    categories = list(ELEMENTS)
+    for i, name in enumerate(ELEMENTS):
+        codes[ element == name.encode() ] = i
+    for name in np.unique( element[codes == -1] ): # elements not in ELEMENTS
+        codes[ element == name ] = len(categories)
+        categories.append( name.decode() )
+    
+    data = pd.DataFrame( {"Station ID": pd.Categorical.from_codes(np.repeat(stationID[0], length), stationID[1]) ,\
+                          "Country"   : pd.Categorical.from_codes(np.repeat(country[0],   length), country[1])   ,\
+                          "Year"      : np.concatenate([ station.year  for station in stations ]).astype(np.int16)   ,\
+                          "Month"     : np.concatenate([ station.month for station in stations ]).astype(np.int8)    ,\
+                          "Element"   : pd.Categorical.from_codes(codes, categories)                               ,\
+                          "Value"     : np.concatenate([ station.value for station in stations ]).astype(np.float32) ,\
+                          },
+                         columns=["Station ID", "Country", "Year", "Month", "Element", "Value"]
                         )
-        
-        data = pd.DataFrame.from_dict(data) # put everything into a DataFrame
-        return data
-        
+    return data
+
+
+def _parseMember(args):
+    """ Worker of the process pool, see WeatherData._loadTar() """
+    stationID, raw, years, elements = args
+    return parseStation(raw, years, stationID, elements)
+
+
+
+# One line of the .dly files, i.e. one month of one element. Please also
+# refer to the readme in the data/climate folder.
+DLY_LINE = 269
+
+DLY_RECORD = np.dtype([ ("station" , "S11")         ,\
+                        ("year"    , np.int16)      ,\
+                        ("month"   , np.int8)       ,\
+                        ("element" , "S4")          ,\
+                        ("value"   , np.int16, 31)  ,\
+                        ("mflag"   , "S1", 31)      ,\
+                        ("qflag"   , "S1", 31)      ,\
+                        ("sflag"   , "S1", 31)
+                      ])
+
+
+def readDly(raw, elements=None):
+    """
+    Read the content of one .dly file into a numpy structured array.
     
-    def _readline(self, line):
-        """
-        Read the weather station data. Please also refer to the readme in
-        the data/climate folder.
-        """
-        stationID   = line[:11].strip()
-        year        = int(line[11:15].strip())
-        month       = int(line[15:17].strip())
-        element     = line[17:21].strip()
-        value_day1  = line[21:26].strip()
-        qflag_day1  = line[27:28].strip()
-        value_day2  = line[29:34].strip()
-        qflag_day2  = line[35:36].strip()
-        value_day3  = line[37:42].strip()
-        qflag_day3  = line[43:44].strip()
-        value_day4  = line[45:50].strip()
-        qflag_day4  = line[53:54].strip()
-        value_day5  = line[53:58].strip()
-        qflag_day5  = line[59:60].strip()
-        value_day6  = line[61:66].strip()
-        qflag_day6  = line[69:68].strip()
-        value_day7  = line[69:74].strip()
-        qflag_day7  = line[77:76].strip()
-        value_day8  = line[77:82].strip()
-        qflag_day8  = line[83:84].strip()
-        value_day9  = line[85:90].strip()
-        qflag_day9  = line[91:92].strip()
-        value_day10 = line[93:98].strip()
-        qflag_day10 = line[99:100].strip()
-        value_day11 = line[101:106].strip()
-        qflag_day11 = line[107:108].strip()
-        value_day12 = line[109:114].strip()
-        qflag_day12 = line[115:116].strip()
-        value_day13 = line[117:122].strip()
-        qflag_day13 = line[123:124].strip()
-        value_day14 = line[125:130].strip()
-        qflag_day14 = line[131:132].strip()
-        value_day15 = line[133:138].strip()
-        qflag_day15 = line[139:140].strip()
-        value_day16 = line[141:146].strip()
-        qflag_day16 = line[147:148].strip()
-        value_day17 = line[149:154].strip()
-        qflag_day17 = line[155:156].strip()
-        value_day18 = line[157:162].strip()
-        qflag_day18 = line[163:164].strip()
-        value_day19 = line[165:170].strip()
-        qflag_day19 = line[171:172].strip()
-        value_day20 = line[173:178].strip()
-        qflag_day20 = line[179:180].strip()
-        value_day21 = line[181:186].strip()
-        qflag_day21 = line[187:188].strip()
-        value_day22 = line[189:194].strip()
-        qflag_day22 = line[195:196].strip()
-        value_day23 = line[197:202].strip()
-        qflag_day23 = line[203:204].strip()
-        value_day24 = line[205:210].strip()
-        qflag_day24 = line[211:212].strip()
-        value_day25 = line[213:218].strip()
-        qflag_day25 = line[219:220].strip()
-        value_day26 = line[221:226].strip()
-        qflag_day26 = line[227:228].strip()
-        value_day27 = line[229:234].strip()
-        qflag_day27 = line[235:236].strip()
-        value_day28 = line[237:242].strip()
-        qflag_day28 = line[243:244].strip()
-        value_day29 = line[245:250].strip()
-        qflag_day29 = line[251:252].strip()
-        value_day30 = line[253:258].strip()
-        qflag_day30 = line[259:260].strip()
-        value_day31 = line[261:266].strip()
-        qflag_day31 = line[267:268].strip()
-        
-        values = [value_day1, value_day2, value_day3, value_day4     ,\
-                  value_day5, value_day6, value_day7, value_day8     ,\
-                  value_day9, value_day10, value_day11, value_day12  ,\
-                  value_day13, value_day14, value_day15, value_day16 ,\
-                  value_day17, value_day18, value_day19, value_day20 ,\
-                  value_day21, value_day22, value_day23, value_day24 ,\
-                  value_day25, value_day26, value_day27, value_day28 ,\
-                  value_day29, value_day30, value_day31              ,\
-                  ]
-        
-        qflags = [qflag_day1, qflag_day2, qflag_day3, qflag_day4, qflag_day5      ,\
-                  qflag_day6, qflag_day7, qflag_day8, qflag_day9, qflag_day10     ,\
-                  qflag_day11, qflag_day12, qflag_day13, qflag_day14, qflag_day15 ,\
-                  qflag_day16, qflag_day17, qflag_day18, qflag_day19, qflag_day20 ,\
-                  qflag_day21, qflag_day22, qflag_day23, qflag_day24, qflag_day25 ,\
-                  qflag_day26, qflag_day27, qflag_day28, qflag_day29, qflag_day30 ,\
-                  qflag_day31                                                     ,\
-                 ]
-        
-        assert( len(values) == len(qflags) ) # sanity check
-
-        # Only keep values that passed all quality checks and are not missing
-        values = [ float(item) for idx, item in enumerate(values) if qflags[idx] == "" and item != '-9999' ]
-
-        # Check if all readings were removed.
-        if len(values) == 0:
-            value = None
-        else:
-            value = np.average(values)
-            
-        return stationID, year, month, element, value
+    The fixed width lines are viewed as one (lines x characters) byte array
+    and all columns are decoded at once, i.e. there is no loop over the
+    lines or the days.
+    
+    Input:
+      raw (bytes):      Content of the .dly file
+      
+      elements (list):  Only decode the lines of these elements, all if None
+    
+    Output:
+      records (np.array): Structured array (dtype DLY_RECORD) with one entry
+                          per line. Missing values are -9999.
+    """
+    chars = _dlyLines(raw)
+    if elements is not None:
+        chars = chars[ np.isin(_asBytes(chars[:,17:21]), [ e.encode() for e in elements ]) ]
+    days  = chars[:,21:DLY_LINE].reshape(-1, 31, 8) # value, mflag, qflag, sflag
+    
+    records = np.empty(len(chars), dtype=DLY_RECORD)
+    records["station"] = _asBytes(chars[:,  0:11])
+    records["year"]    = _asInt(  chars[:, 11:15])
+    records["month"]   = _asInt(  chars[:, 15:17])
+    records["element"] = _asBytes(chars[:, 17:21])
+    records["value"]   = _asInt(  days[:,:,0:5])
+    records["mflag"]   = _asBytes(days[:,:,5:6])
+    records["qflag"]   = _asBytes(days[:,:,6:7])
+    records["sflag"]   = _asBytes(days[:,:,7:8])
+    return records
+
+
+def scanSpans(raw, years):
+    """
+    Get the first and last year of each element of one .dly file within the
+    year range. Only the year and element columns are decoded.
+    
+    Output:
+      spans (dict):  element -> (first year, last year)
+    """
+    chars   = _dlyLines(raw)
+    year    = _asInt(chars[:,11:15])
+    element = _asBytes(chars[:,17:21])
+    keep    = (year >= years[0]) & (year <= years[1])
+    year, element = year[keep], element[keep]
+    
+    spans = dict()
+    for name in np.unique(element):
+        elementYears = year[ element == name ]
+        spans[ name.decode() ] = ( int(elementYears.min()), int(elementYears.max()) )
+    return spans
+
+
+def readInventory(fname):
+    """
+    Read the GHCN inventory file (ghcnd-inventory.txt), i.e. the first and
+    last year of each station and element.
+    
+    Output:
+      spans (dict):  stationID -> {element -> (first year, last year)}
+    """
+    spans = dict()
+    with open(fname, 'r') as f:
+        for line in f:
+            fields = line.split() # ID, latitude, longitude, element, first, last
+            if len(fields) < 6:
+                continue
+            spans.setdefault(fields[0], dict())[fields[3]] = ( int(fields[4]), int(fields[5]) )
+    return spans
+
+
+def _dlyLines(raw):
+    """ View the content of a .dly file as (lines x characters) byte array """
+    chars = np.frombuffer(raw, dtype=np.uint8)
+    
+    # Lines are DLY_LINE characters plus the line break. If the file does not
+    # follow this exactly (e.g. trailing whitespace removed) pad the lines.
+    if len(chars) % (DLY_LINE+1) != 0 or \
+       np.any(chars[DLY_LINE::DLY_LINE+1] != ord('\n')):
+        lines = [ line[:DLY_LINE].ljust(DLY_LINE) for line in raw.splitlines() if line.strip() ]
+        chars = np.frombuffer(b"\n".join(lines) + b"\n", dtype=np.uint8)
+    
+    return chars.reshape(-1, DLY_LINE+1)
+
+
+def monthlyAverage(records):
+    """
+    Take the average of the daily values of each record (i.e. each month).
+    
+    Only values that passed all quality checks and are not missing are used.
+    Records without any usable value are NaN.
+    
+    Output:
+      year, month, value (np.array):  One entry per record
+    """
+    valid = (records["qflag"] == b" ") & (records["value"] != -9999)
+    count = valid.sum(axis=1)
+    total = np.where(valid, records["value"], 0).sum(axis=1, dtype=np.int64)
+    
+    with np.errstate(invalid="ignore", divide="ignore"):
+        value = np.where(count > 0, total / count.astype(np.float64), np.nan)
+    
+    return records["year"], records["month"], value
 
 
+def _asBytes(chars):
+    """ View the last axis of a byte array as fixed size strings. """
+    chars = np.ascontiguousarray(chars)
+    return chars.view("S%d" %chars.shape[-1])[...,0]
+
+
+def _asInt(chars):
+    """
+    Decode right aligned integers (e.g. "  -12") from the last axis of a
+    byte array. Blanks count as zero, a minus sign negates the number.
+    """
+    # Blanks and minus signs are below "0", i.e. become zero digits
+    digits   = np.maximum(chars, ord('0')) - ord('0')
+    value    = np.zeros(chars.shape[:-1], dtype=np.int32)
+    negative = np.zeros(chars.shape[:-1], dtype=bool)
+    for i in range(chars.shape[-1]): # loop over the (few) characters only
+        value    *= 10
+        value    += digits[...,i]
+        negative |= chars[...,i] == ord('-')
+    np.negative(value, out=value, where=negative)
+    return value
+
 
 class WeatherStationMapper(object):
     """
@@ -443,21 +1500,25 @@ class WeatherStationMapper(object):
     return all stations for one country
     """
 
-    def __init__(self, fname, mapper="../data/geolocation/LatLon2Country.csv"):
+    def __init__(self, fname, mapper="../data/geolocation/LatLon2Country.csv", maxDistance=5.):
         
         self.mapper     = DoubleDict()
         self.geolocator = None
         self.stations   = None
+        self.weights    = None   # area share of each station, see LatLon2Country.weights()
+        self.notFound   = list() # stations without a known location nearby
         
-        self.LatLon2Country = LatLon2Country(mapper)
+        self.fnameMapper    = mapper
+        self.maxDistance    = maxDistance
+        self.LatLon2Country = LatLon2Country(mapper, maxDistance)
         
-        self.stations = self._loadData(fname)
+        self.stations, self.weights = self._loadData(fname)
     
     def __call__(self, station):
         try:
             return self.stations[station]
         except KeyError:
-            return np.NaN
+            return np.nan
         
 #    def _LatLon2Country(self, lat, lon):
 #        sleep(1)                 # make sure there are not too many request
@@ -469,31 +1530,49 @@ class WeatherStationMapper(object):
 
     def _loadData(self, fname):
         """
-        Load the station data and map them to 2 letter country code
+        Load the station data and map them to their country
+        
+        All stations are mapped at once to the nearest known location
+        (see LatLon2Country). The countries and the weights of the stations
+        are kept in a binary copy (.npz) next to the station list, i.e. they
+        are only computed again if one of the input files changed.
         """
+        fnameCache = os.path.splitext(fname)[0] + ".npz"
+        if os.path.isfile(fnameCache) and \
+           os.path.getmtime(fnameCache) >= max( os.path.getmtime(fname), os.path.getmtime(self.fnameMapper) ):
+            with np.load(fnameCache, allow_pickle=False) as cache:
+                if float(cache["maxDistance"]) == self.maxDistance and \
+                   "grid" in cache and list(cache["grid"]) == [GRID_SIZE, GRID_DISTANCE]:
+                    stationName = cache["station"].astype(str).astype(object)
+                    country     = cache["country"].astype(str).astype(object)
+                    weight      = cache["weight"]
+                    self.notFound = list( cache["notFound"].astype(str) )
+                    return dict( zip(stationName, country) ), dict( zip(stationName, weight) )
+        
         with open(fname, 'r') as f:
-            lines = f.readlines()
+            lines = [ line for line in f if line.strip() ]
         
         assert( lines[0].strip() == "ACW00011604  17.1167  -61.7833   10.1    ST JOHNS COOLIDGE FLD")
-
-        stations = dict()
-        notFound = 0
-        for count, line in enumerate(lines):
-            # Get the station info
-            stationName = line[:11].strip()
-            lat         = line[12:20].strip()
-            lon         = line[21:30].strip()
-
-            # Map station to country
-            try:
-                country = self.LatLon2Country[(lat, lon)]
-            except KeyError:
-                notFound += 1
-                continue
-
-            stations[stationName] = country
-#        print("Missed %d" %notFound)
-        return stations
+        
+        stationName = np.array( [ line[:11].strip()  for line in lines ], dtype=object )
+        lat         = np.array( [ line[12:20].strip() for line in lines ] ).astype(np.float64)
+        lon         = np.array( [ line[21:30].strip() for line in lines ] ).astype(np.float64)
+        
+        # Map all stations to their country at once
+        country = self.LatLon2Country.query(lat, lon)
+        
+        weight  = self.LatLon2Country.weights(country, lat, lon)
+        
+        found = pd.notnull(country)
+        self.notFound = list( stationName[~found] )
+        try:
+            with open(fnameCache, 'wb') as f:
+                np.savez(f, station=stationName[found].astype(str), country=country[found].astype(str), \
+                            weight=weight[found], notFound=np.asarray(self.notFound, dtype=str), \
+                            maxDistance=self.maxDistance, grid=[GRID_SIZE, GRID_DISTANCE])
+        except (IOError, OSError):
+            pass # the binary copy is optional
+        return dict( zip(stationName[found], country[found]) ), dict( zip(stationName[found], weight[found]) )
 
     def station2country(self, station):
         if station not in self.stations:
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+
+Climate indices computed from the daily GHCN data (see dailyStore.py).
+
+Each index is a vectorized function registered with the register()
+decorator. It gets a Block, i.e. the records of one element for a chunk of
+stations, and returns one value per station and year. The ClimateIndices
+engine evaluates all registered indices in one pass over the store and
+averages the stations of each country, e.g.
+
+    store   = DailyStore("../data/climate/ghcnd_gsn.store")
+    mapper  = WeatherStationMapper("../data/climate/ghcnd-stations.txt")
+    indices = ClimateIndices(store, mapper)()
+
+gives a DataFrame with the columns Country, Year and one column per index
+that can be merged with the other data (see DataContainer).
+
+New indices are added with
+
+    @register("FrostDays", "TMIN")
+    def frostDays(block):
+        frost = block.valid & (block.days < 0)
+        return block.perYear( frost.sum(axis=1), np.add )
+
+----
+
+Copyright (C) 2015  Niklas Berliner
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+import numpy as np
+import pandas as pd
+
+
+# The registered indices, name -> (element, function)
+INDICES = dict()
+
+
+def register(name, element):
+    """
+    Register a climate index (decorator).
+
+    Input:
+      name (str):     The column name of the index in the result
+
+      element (str):  The element the index is computed from, e.g. "TMAX"
+
+    The decorated function gets a Block and returns the value of each
+    station-year of the block, i.e. an array of length len(block.stationYears).
+    """
+    def decorator(function):
+        INDICES[name] = (element, function)
+        return function
+    return decorator
+
+
+class Block(object):
+
+    def __init__(self, stations, year, month, days, valid):
+        """
+        The records of one element for a chunk of stations. The records are
+        sorted by station, year and month.
+
+        Attributes:
+          stations (np.array):     Station (index) of each record
+
+          year, month (np.array):  Year and month of each record
+
+          days (np.array):         The daily values (records x 31)
+
+          valid (np.array):        True for days with a valid value (records x 31)
+
+          stationYears (np.array): The first record of each station-year
+        """
+        self.stations = stations
+        self.year     = year
+        self.month    = month
+        self.days     = days
+        self.valid    = valid
+
+        newYear = np.ones(len(year), dtype=bool)
+        newYear[1:] = (stations[1:] != stations[:-1]) | (year[1:] != year[:-1])
+        self.stationYears = np.flatnonzero(newYear)
+
+    def __len__(self):
+        return len(self.year)
+
+    def perYear(self, values, ufunc=np.add):
+        """
+        Reduce values given per record to one value per station-year, e.g.
+        block.perYear(counts, np.add) or block.perYear(maxima, np.maximum).
+        """
+        if len(self) == 0:
+            return np.zeros(0)
+        return ufunc.reduceat(values, self.stationYears)
+
+    def stationIndex(self):
+        """ The station (index) of each station-year """
+        return self.stations[self.stationYears]
+
+    def existing(self):
+        """
+        True for the days that exist (records x 31), e.g. False for the 30th
+        of February.
+        """
+        length = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])[ self.month.astype(int) - 1 ]
+        year   = self.year.astype(int)
+        leap   = (year % 4 == 0) & ( (year % 100 != 0) | (year % 400 == 0) )
+        length = length + ( leap & (self.month == 2) )
+        return np.arange(31)[None,:] < length[:,None]
+
+    def monthly(self):
+        """ The average of the valid days of each record, NaN if there is none """
+        count = self.valid.sum(axis=1)
+        total = np.where(self.valid, self.days, 0).sum(axis=1, dtype=np.int64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(count > 0, total / count.astype(np.float64), np.nan)
+
+
+class ClimateIndices(object):
+
+    def __init__(self, store, mapper, indices=None, years=None, chunksize=500):
+        """
+        Evaluate climate indices for all stations of a DailyStore.
+
+        Input:
+          store (DailyStore):  The daily data
+
+          mapper (callable):   Maps the station ID to its country, e.g. a
+                               WeatherStationMapper
+
+          indices (list):      Names of the (registered) indices to evaluate,
+                               all if None
+
+          years (list):        List of two integers specifing the year range
+                               that should be kept
+
+          chunksize (int):     Number of stations read at once
+        """
+        self.store     = store
+        self.mapper    = mapper
+        self.indices   = sorted(INDICES) if indices is None else list(indices)
+        self.years     = years
+        self.chunksize = chunksize
+
+        for name in self.indices:
+            if name not in INDICES:
+                raise KeyError("Climate index %r is not registered" %name)
+
+    def __call__(self):
+        """ See compute() """
+        return self.compute()
+
+    def compute(self):
+        """
+        Evaluate all indices in one pass over the store.
+
+        Output:
+          data (DataFrame):  The country average of each index with the
+                             columns Country, Year and one per index
+        """
+        elements = dict()
+        for name in self.indices:
+            elements.setdefault(INDICES[name][0], list()).append(name)
+
+        perStation = list()
+        for first in range(0, len(self.store.stations), self.chunksize):
+            last    = min(first + self.chunksize, len(self.store.stations))
+            records = np.arange( int(self.store.offset[first]), int(self.store.offset[last]) )
+            element = self.store.element[records]
+
+            for elementName, names in elements.items():
+                if elementName not in self.store.elements:
+                    continue
+                block = self._block( records[ element == self.store.elements.index(elementName) ] )
+                if len(block) == 0:
+                    continue
+                for name in names:
+                    perStation.append( pd.DataFrame( {"Station" : block.stationIndex()             ,\
+                                                      "Year"    : block.year[block.stationYears]   ,\
+                                                      "Index"   : name                             ,\
+                                                      "Value"   : INDICES[name][1](block)          ,\
+                                                      } ) )
+
+        if not perStation:
+            return pd.DataFrame(columns=["Country", "Year"] + self.indices)
+        data = pd.concat(perStation, ignore_index=True)
+
+        # Map the stations to their countries (once per station)
+        stations  = np.unique(data["Station"])
+        countries = pd.Series( [ self.mapper(self.store.stations[i]) for i in stations ], index=stations )
+        data["Country"] = countries.reindex(data["Station"].values).values
+        data = data[ pd.notnull(data["Country"]) ]
+
+        # Average the stations of each country
+        result = data.pivot_table(index=["Country", "Year"], columns="Index", values="Value", aggfunc="mean")
+        result = result.reindex(columns=self.indices)
+        result.columns.name = None
+        result.reset_index(inplace=True)
+        if self.years is not None:
+            result = result[ (result["Year"] >= self.years[0]) & (result["Year"] <= self.years[1]) ]
+        return result.reset_index(drop=True)
+
+    def _block(self, records):
+        """ Read the records into a Block, sorted by station, year and month """
+        stations = self.store.station[records]
+        year     = self.store.year[records]
+        month    = self.store.month[records]
+        order    = np.lexsort( (month, year, stations) )
+        records  = records[order]
+        return Block( stations[order], year[order], month[order], \
+                      np.asarray(self.store.days(records)), self.store.valid(records) )
+
+
+# Parameters of the indices below
+HOT_PERCENTILE = 90  # hot days are above this percentile of the station
+DRY_DAY        = 10  # days with less than 1mm (in tenth of mm) are dry
+MIN_COVERAGE   = 0.9 # fraction of valid days needed for annual totals
+
+
+@register("HotDays", "TMAX")
+def hotDays(block):
+    """
+    Number of days per year with a maximum temperature above the
+    HOT_PERCENTILE percentile of all days of the station.
+    """
+    days     = np.where(block.valid, block.days, np.nan).astype(np.float64)
+    stations = np.repeat(block.stations, 31)
+    values   = days.ravel()
+    known    = ~np.isnan(values)
+
+    threshold = pd.Series(values[known]).groupby(stations[known]).quantile(HOT_PERCENTILE / 100.)
+    threshold = threshold.reindex(block.stations).values
+
+    with np.errstate(invalid="ignore"):
+        hot = days > threshold[:,None]
+    return block.perYear( hot.sum(axis=1), np.add )
+
+
+@register("DrySpell", "PRCP")
+def longestDrySpell(block):
+    """
+    Longest run of consecutive dry days (less than 1mm) per year. Missing
+    days end a dry spell, days that do not exist (e.g. 30 February) are
+    skipped.
+    """
+    existing = block.existing()
+    dry      = ( block.valid & (block.days < DRY_DAY) )[existing]
+    position = np.arange(len(dry))
+
+    # First day of each station-year in the sequence of existing days
+    daysPerRecord = existing.sum(axis=1)
+    recordStart   = np.concatenate( ([0], np.cumsum(daysPerRecord)[:-1]) )
+    yearStart     = recordStart[block.stationYears]
+    start         = np.zeros(len(dry), dtype=np.int64)
+    start[yearStart] = yearStart
+
+    # Run-length encoding: the current run starts after the last wet (or
+    # missing) day or at the start of the year.
+    start = np.maximum( start, np.where(dry, 0, position+1) )
+    start = np.maximum.accumulate(start)
+    run   = position + 1 - start
+    return np.maximum.reduceat(run, yearStart)
+
+
+@register("PrecipAnomaly", "PRCP")
+def precipitationAnomaly(block):
+    """
+    Annual precipitation relative to the average annual precipitation of
+    the station (in percent). Years with less than MIN_COVERAGE valid days
+    are NaN.
+    """
+    total = block.perYear( np.where(block.valid, block.days, 0).sum(axis=1, dtype=np.int64), np.add )
+    valid = block.perYear( block.valid.sum(axis=1), np.add )
+
+    # Scale to a full year
+    years  = block.year[block.stationYears].astype(int)
+    length = 365 + ( (years % 4 == 0) & ( (years % 100 != 0) | (years % 400 == 0) ) )
+    with np.errstate(invalid="ignore", divide="ignore"):
+        annual = np.where( valid >= MIN_COVERAGE * length, total / valid.astype(np.float64) * length, np.nan )
+
+    stations = block.stationIndex()
+    average  = pd.Series(annual).groupby(stations).transform("mean").values
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where( average > 0, 100. * (annual - average) / average, np.nan )
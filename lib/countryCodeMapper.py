@@ -23,6 +23,7 @@ with this program; if not, write to the Free Software Foundation, Inc.,
 
 """
 import numpy as np
+import pandas as pd
 
 class CountryCodeMapper(object):
     
@@ -693,6 +694,8 @@ class CountryCodeMapper(object):
                                 "Various/Unknown":"VAR"
                             }
         
+        self.cache = dict() # names looked up by convert()
+        
     def __call__(self, s):
         """
         Return the three letter country code
@@ -706,13 +709,43 @@ class CountryCodeMapper(object):
 #            print("Country Code %s not understood." %s)
             return False
     
-    def convert(self, s):
+    def convert(self, s, cache=True):
         """
-        Vectorized version of the __call__ method. Not speed optimised
-        but will work on whole Series objects.
+        Vectorized version of the __call__ method. Works on whole Series
+        objects (or any array like).
+        
+        The input is factorised and only the unique values are looked up,
+        i.e. the cost depends on the number of distinct names, not on the
+        number of rows. Categorical input is not factorised again, only its
+        categories are looked up.
+        
+        Input:
+          s (array like):  Country names or codes
+          
+          cache (bool):    Remember the names that were looked up (including
+                           the ones not understood) for the next calls
+        
+        Output:
+          codes (pd.Categorical): The three letter country codes, NaN for
+                                  names that are not understood
         """
-        vfunc = np.vectorize(self._convert)
-        return(vfunc(s))
+        if isinstance(s, pd.Series):
+            s = s.values
+        if isinstance(s, pd.Categorical):
+            codes, uniques = s.codes, np.asarray(s.categories, dtype=object)
+        else:
+            codes, uniques = pd.factorize( np.asarray(s, dtype=object) )
+        
+        lookup = self.cache if cache else dict()
+        for name in uniques:
+            if name not in lookup:
+                lookup[name] = self.countryMap.get(name, None)
+        mapped = np.array( [ lookup[name] for name in uniques ], dtype=object )
+        
+        # Broadcast the codes of the unique values back to the input
+        inverse, categories = pd.factorize(mapped, sort=True) # None -> -1
+        inverse = np.append(inverse, -1) # missing input values (code -1)
+        return pd.Categorical.from_codes( inverse[codes], categories )
     
     def countryNames(self):
         """ Return the "full" country names and their synonyms. """
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+
+Store for the daily GHCN climate data (see climateData.py).
+
+The .dly files of the archive are parsed once and all daily values are
+kept in one binary file, which is memory-mapped when reading. Analyses
+based on daily values can thus use the days directly instead of parsing
+the archive again.
+
+File layout (all little endian, each section aligned to 8 bytes):
+
+    magic       b"DLYSTOR1"
+    value       int16  (records, 31)  the daily values, -9999 if missing
+    qc          uint32 (records,)     bit d is set if day d+1 failed a
+                                      quality check (QFLAG not blank)
+    station     uint32 (records,)     index into the station list
+    element     uint16 (records,)     index into the element list
+    year        int16  (records,)
+    month       int8   (records,)
+    offset      uint64 (stations+1,)  the records of station i are
+                                      offset[i]:offset[i+1]
+    header      json                  the station and element lists and
+                                      the offset, dtype, shape of the
+                                      sections
+    length      uint64                length of the header
+    magic       b"DLYSTOR1"
+
+----
+
+Copyright (C) 2015  Niklas Berliner
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+import os
+import json
+import struct
+import numpy as np
+
+from climateData import iterTar, readDly
+
+
+MAGIC   = b"DLYSTOR1"
+MISSING = -9999
+
+
+class DailyStore(object):
+
+    def __init__(self, fname):
+        """
+        Open a daily store created with DailyStore.build(). All sections
+        are memory-mapped (read-only), i.e. opening the store is cheap and
+        only the days that are used are read from disk.
+
+        Input:
+          fname (str):  Location of the store
+        """
+        self.fname = fname
+
+        with open(fname, 'rb') as f:
+            assert( f.read(len(MAGIC)) == MAGIC )
+            f.seek(-len(MAGIC)-8, os.SEEK_END)
+            length = struct.unpack("<Q", f.read(8))[0]
+            assert( f.read(len(MAGIC)) == MAGIC )
+            f.seek(-len(MAGIC)-8-length, os.SEEK_END)
+            header = json.loads( f.read(length).decode("utf-8") )
+
+        self.stations = header["stations"]
+        self.elements = header["elements"]
+        self.source   = header["source"]
+
+        for name, (offset, dtype, shape) in header["sections"].items():
+            if np.prod(shape) == 0:
+                section = np.zeros(shape, dtype=dtype)
+            else:
+                section = np.memmap(fname, dtype=dtype, mode='r', offset=offset, shape=tuple(shape))
+            setattr(self, name, section)
+
+        self._stationIndex = dict( (stationID, i) for i, stationID in enumerate(self.stations) )
+
+    def __len__(self):
+        """ The number of records, i.e. months of one element of one station """
+        return len(self.year)
+
+    def __repr__(self):
+        return "DailyStore Object: %d stations; %d records; Elements: %r" %(len(self.stations), len(self), self.elements)
+
+    @classmethod
+    def build(cls, fname, archive, elements=None):
+        """
+        Create the store from the GHCN archive (e.g. ghcnd_gsn.tar.gz).
+
+        The archive is read as a stream and the daily values are written
+        while reading, i.e. the memory use does not depend on the size of
+        the archive (apart from the index, 13 bytes per record).
+
+        Input:
+          fname (str):     Location of the store that is created
+
+          archive (str):   Location of the GHCN archive
+
+          elements (list): The elements to keep, all if None
+
+        Output:
+          store (DailyStore):  The opened store
+        """
+        stations, elementList = list(), list() if elements is None else list(elements)
+        qc, station, element, year, month = list(), list(), list(), list(), list()
+        offset = [0, ]
+
+        with open(fname + ".tmp", 'wb') as f:
+            f.write(MAGIC)
+            sections = dict()
+            start    = _align(f)
+            for stationID, member in iterTar(archive):
+                records = readDly(member.read())
+                codes   = _elementCodes(records["element"], elementList, elements is None)
+                records = records[ codes >= 0 ]
+
+                f.write( records["value"].astype("<i2").tobytes() )
+                qc.append(      _packDays(records["qflag"] != b" ") )
+                station.append( np.full(len(records), len(stations), dtype=np.uint32) )
+                element.append( codes[ codes >= 0 ].astype(np.uint16) )
+                year.append(    records["year"] )
+                month.append(   records["month"] )
+
+                stations.append( records["station"][0].decode() if len(records) > 0 else stationID )
+                offset.append( offset[-1] + len(records) )
+            # The full GHCN archive has more than a hundred elements (e.g.
+            # WT01..WT22, SX11..SX83)
+            assert( len(elementList) <= np.iinfo(np.uint16).max + 1 )
+            sections["value"] = (start, "<i2", [offset[-1], 31])
+
+            for name, values, dtype in ( ("qc",      qc,      "<u4") ,\
+                                         ("station", station, "<u4") ,\
+                                         ("element", element, "<u2") ,\
+                                         ("year",    year,    "<i2") ,\
+                                         ("month",   month,   "i1")  ):
+                start  = _align(f)
+                values = np.concatenate(values) if values else np.zeros(0)
+                f.write( values.astype(dtype).tobytes() )
+                sections[name] = (start, dtype, [len(values)])
+
+            start = _align(f)
+            f.write( np.asarray(offset, dtype="<u8").tobytes() )
+            sections["offset"] = (start, "<u8", [len(offset)])
+
+            header = json.dumps( { "stations" : stations    ,\
+                                   "elements" : elementList ,\
+                                   "source"   : os.path.split(archive)[1] ,\
+                                   "sections" : sections
+                                 } ).encode("utf-8")
+            f.write(header)
+            f.write(struct.pack("<Q", len(header)))
+            f.write(MAGIC)
+
+        os.replace(fname + ".tmp", fname)
+        return cls(fname)
+
+    def records(self, stations=None, elements=None, years=None, months=None):
+        """
+        Get the records (indexes) matching the selection. None selects all.
+
+        Input:
+          stations (list):  Station IDs
+
+          elements (list):  Element names, e.g. ["TMAX", "PRCP"]
+
+          years (list):     List of two integers specifing the year range
+
+          months (list):    Months (1-12)
+
+        Output:
+          records (np.array): The selected record indexes
+        """
+        if stations is None:
+            keep = np.ones(len(self), dtype=bool)
+        else:
+            keep = np.zeros(len(self), dtype=bool)
+            for stationID in stations:
+                i = self._stationIndex.get(stationID)
+                if i is not None:
+                    keep[ self.offset[i]:self.offset[i+1] ] = True
+
+        if elements is not None:
+            codes = [ self.elements.index(name) for name in elements if name in self.elements ]
+            keep &= np.isin(self.element, codes)
+        if years is not None:
+            keep &= (self.year >= years[0]) & (self.year <= years[1])
+        if months is not None:
+            keep &= np.isin(self.month, months)
+        return np.flatnonzero(keep)
+
+    def stationRecords(self, stationID):
+        """ The records of one station as slice """
+        i = self._stationIndex[stationID]
+        return slice( int(self.offset[i]), int(self.offset[i+1]) )
+
+    def days(self, records=slice(None)):
+        """ The daily values (records x 31), -9999 if missing """
+        return self.value[records]
+
+    def valid(self, records=slice(None)):
+        """
+        True for the days (records x 31) that have a value which passed all
+        quality checks. Days that do not exist (e.g. 30 February) are missing
+        in the archive, i.e. they are not valid.
+        """
+        return ~_unpackDays(self.qc[records]) & (self.value[records] != MISSING)
+
+    def monthlyAverage(self, records=slice(None)):
+        """
+        The average of the valid days of each record, NaN if there is none.
+        Gives the same values as climateData.monthlyAverage().
+        """
+        valid = self.valid(records)
+        count = valid.sum(axis=1)
+        total = np.where(valid, self.value[records], 0).sum(axis=1, dtype=np.int64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(count > 0, total / count.astype(np.float64), np.nan)
+
+    def stationIDs(self, records=slice(None)):
+        """ The station ID of each record """
+        return np.asarray(self.stations, dtype=object)[ self.station[records] ]
+
+    def elementNames(self, records=slice(None)):
+        """ The element name of each record """
+        return np.asarray(self.elements, dtype=object)[ self.element[records] ]
+
+
+# Bit d of the packed days is day d+1 of the month
+_DAYBITS = np.left_shift(np.uint32(1), np.arange(31, dtype=np.uint32))
+
+
+def _packDays(days):
+    """ Pack a boolean (records x 31) array into one uint32 per record """
+    return np.bitwise_or.reduce(np.where(days, _DAYBITS, np.uint32(0)), axis=1).astype(np.uint32)
+
+
+def _unpackDays(packed):
+    """ Unpack uint32 per record into a boolean (records x 31) array """
+    return ( np.asarray(packed, dtype=np.uint32)[:,None] & _DAYBITS ) != 0
+
+
+def _elementCodes(names, elementList, extend):
+    """
+    Get the index of each element name (bytes) in elementList, -1 if it is
+    not in the list. With extend=True unknown elements are added.
+    """
+    codes = np.full(len(names), -1, dtype=np.int32)
+    for name in np.unique(names):
+        element = name.decode()
+        if element not in elementList:
+            if not extend:
+                continue
+            elementList.append(element)
+        codes[ names == name ] = elementList.index(element)
+    return codes
+
+
+def _align(f, alignment=8):
+    """ Pad the file to the alignment, returns the position """
+    position = f.tell()
+    if position % alignment:
+        f.write( b"\0" * (alignment - position % alignment) )
+    return f.tell()
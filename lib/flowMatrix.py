@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""
+
+Origin-destination matrices of the migration data (see migrationData.py).
+
+The migration data comes as long rows of (Year, Country, Origin, values).
+FlowMatrix keeps each value column of each year as a sparse matrix with the
+destination countries as rows and the origin countries as columns, e.g.
+
+    flows = UNHCRdata(fname).flows
+    flows.matrix("Total Population", 2010)     # scipy.sparse CSR matrix
+    flows.inflows("DEU")                       # all origins summed up
+    flows.corridor("DEU", "SYR")               # one corridor over the years
+    flows.partners("DEU", "Total Population", 2010, n=5)
+    flows.network("Total Population")          # PageRank etc. of all years
+
+All lookups are slices of the sparse matrices, i.e. they only touch the
+non-zero entries of the requested country.
+
+----
+
+Copyright (C) 2015  Niklas Berliner
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+class FlowMatrix(object):
+
+    def __init__(self, data, destination="Country", origin="Origin", year="Year", columns=None):
+        """
+        Create the matrices from the long table.
+
+        Rows with the same year, destination and origin are summed up. Rows
+        without a destination or origin (NaN) are left out, i.e. the data
+        sources map the countries they do not know to "Various/Unknown"
+        (VAR) instead. For
+        each matrix of values the number of known (not NaN) values is kept as
+        well, i.e. missing values can be told apart from zeros.
+
+        Input:
+          data (DataFrame):    The migration data
+
+          destination (str):   Column of the destination country (rows)
+
+          origin (str):        Column of the origin country (columns)
+
+          year (str):          Column of the year
+
+          columns (list):      The value columns, defaults to all numeric
+                               columns apart from year
+        """
+        if columns is None:
+            columns = [ name for name in data.columns if name not in (destination, origin, year) and \
+                                                         pd.api.types.is_numeric_dtype(data[name]) ]
+        self.columns = list(columns)
+
+        # One integer code for each country, shared by rows and columns
+        destinations = np.asarray(data[destination], dtype=object)
+        origins      = np.asarray(data[origin],      dtype=object)
+        keep = pd.notnull(destinations) & pd.notnull(origins)
+        codes, countries = pd.factorize( np.concatenate( (destinations[keep], origins[keep]) ), sort=True )
+        self.countries = [ str(country) for country in countries ]
+        self.index     = dict( (country, i) for i, country in enumerate(self.countries) )
+
+        rows, cols = codes[:keep.sum()], codes[keep.sum():]
+        years      = np.asarray(data[year])[keep]
+        self.years = [ int(y) for y in np.unique(years) ]
+
+        values = dict( (column, np.asarray(data[column], dtype=np.float64)[keep]) for column in self.columns )
+
+        shape = (len(self.countries), len(self.countries))
+        self.records = dict() # year -> number of rows of each destination, origin
+        self.values  = dict() # (column, year) -> sum of the values
+        self.known   = dict() # (column, year) -> number of known values
+        self._csc    = dict() # column major copies, see _entries()
+        for y in self.years:
+            rowsYear = years == y
+            r, c = rows[rowsYear], cols[rowsYear]
+            self.records[y] = sparse.csr_matrix( (np.ones(len(r), dtype=np.int32), (r, c)), shape=shape )
+            for column in self.columns:
+                value = values[column][rowsYear]
+                known = pd.notnull(value)
+                self.values[column, y] = sparse.csr_matrix( (value[known], (r[known], c[known])), shape=shape )
+                self.values[column, y].eliminate_zeros() # zeros are told apart by self.known
+                self.known[column, y]  = sparse.csr_matrix( (np.ones(known.sum(), dtype=np.int32), (r[known], c[known])), shape=shape )
+
+    def __repr__(self):
+        return "FlowMatrix Object: %d countries; %d years; %d columns" %(len(self.countries), len(self.years), len(self.columns))
+
+    def matrix(self, column, year):
+        """ The values of one column and year (destinations x origins) as CSR matrix """
+        return self.values[column, year]
+
+    def totals(self, column, year, by="destination"):
+        """
+        The sum over all partners of each country.
+
+        Input:
+          by (str):  "destination" sums the origins of each destination
+                     (inflows), "origin" the destinations of each origin
+        """
+        axis = 1 if by == "destination" else 0
+        return pd.Series( np.asarray(self.values[column, year].sum(axis=axis)).ravel(), index=self.countries )
+
+    def aggregate(self, by="destination"):
+        """
+        The values of all partners summed up for each country and year, i.e.
+        inflows() (or outflows()) of all countries at once.
+
+        Output:
+          result (DataFrame):  Columns Country, Year and the value columns.
+                               Only the years with data for a country are
+                               kept, sorted by country and year.
+        """
+        axis = 1 if by == "destination" else 0
+        country, year, totals = list(), list(), { column: list() for column in self.columns }
+        for y in self.years:
+            present = np.flatnonzero( self.records[y].getnnz(axis=axis) )
+            country.append(present)
+            year.append( np.full(len(present), y, dtype=np.int16) )
+            for column in self.columns:
+                values = np.asarray( self.values[column, y].sum(axis=axis) ).ravel()
+                totals[column].append( values[present] )
+
+        country = np.concatenate(country) if country else np.zeros(0, dtype=int)
+        year    = np.concatenate(year)    if year    else np.zeros(0, dtype=np.int16)
+        order   = np.lexsort( (year, country) )
+
+        result = pd.DataFrame( {"Country": np.asarray(self.countries, dtype=object)[country[order]] ,\
+                                "Year"   : year[order]                                            ,\
+                               }, columns=["Country", "Year"] )
+        for column in self.columns:
+            result[column] = np.concatenate(totals[column])[order] if totals[column] else np.zeros(0)
+        return result
+
+    def network(self, column, topK=5, damping=0.85, tol=1e-10, maxIter=100, selfLoops=False, exclude=("VAR",)):
+        """
+        Network metrics of each country for every year. The flows of one
+        year are the weighted, directed graph with the edges origin ->
+        destination. All metrics are computed on the sparse matrices of all
+        countries at once:
+        
+          InStrength   Sum of the flows into the country
+          OutStrength  Sum of the flows out of the country
+          NetFlow      InStrength - OutStrength
+          TopShare     Share of the InStrength coming from the topK largest
+                       origins
+          Reciprocity  Flows that are reciprocated, sum_j min(A_ij, A_ji),
+                       relative to the mean of in- and out-strength (0-1)
+          PageRank     PageRank of the country (damping factor damping),
+                       flows are followed from the origin to the destination
+        
+        By default the graph has no self-loops, i.e. the rows with the same
+        origin and destination (e.g. the internally displaced persons of the
+        UNHCR data) are left out, and "Various/Unknown" (VAR) is not taken
+        as a country. The few negative values of the sources are taken as no
+        flow.
+        
+        Input:
+          column (str):   The value column taken as flows
+          
+          topK (int):     Number of origins for TopShare
+          
+          damping (float): Damping factor of the PageRank
+          
+          tol (float):    The PageRank iteration stops once the ranks change
+                          less than tol (L1 norm) or after maxIter iterations
+          
+          selfLoops (bool): Keep the flows within a country
+          
+          exclude (list): Countries that are left out of the graph
+        
+        Output:
+          result (DataFrame): Columns Year, Country and one per metric. Only
+                              the countries with data in a year are kept.
+        """
+        metrics = [ "NetFlow", "InStrength", "OutStrength", "TopShare", "Reciprocity", "PageRank" ]
+        tables  = list()
+        
+        # Remove the self-loops, the excluded countries (rows and columns)
+        # and the negative values
+        keep = np.ones(len(self.countries))
+        keep[ [ self.index[country] for country in exclude if country in self.index ] ] = 0
+        keep = sparse.diags(keep)
+        def graph(matrix):
+            if not selfLoops:
+                matrix = matrix - sparse.diags( matrix.diagonal(), dtype=matrix.dtype )
+            matrix = sparse.csr_matrix(keep @ matrix @ keep)
+            matrix.data = np.maximum(matrix.data, 0)
+            matrix.eliminate_zeros()
+            return matrix
+        
+        for year in self.years:
+            A       = graph( self.values[column, year] )
+            records = graph( self.records[year] )
+            present = (records.getnnz(axis=1) + records.getnnz(axis=0)) > 0
+            
+            inStrength  = np.asarray( A.sum(axis=1) ).ravel()
+            outStrength = np.asarray( A.sum(axis=0) ).ravel()
+            reciprocal  = np.asarray( A.minimum(A.T).sum(axis=1) ).ravel()
+            
+            with np.errstate(invalid="ignore", divide="ignore"):
+                table = { "NetFlow"     : inStrength - outStrength                                   ,\
+                          "InStrength"  : inStrength                                                 ,\
+                          "OutStrength" : outStrength                                                ,\
+                          "TopShare"    : _topSum(A, topK) / inStrength                              ,\
+                          "Reciprocity" : 2 * reciprocal / (inStrength + outStrength)                ,\
+                          "PageRank"    : _pageRank(A, present, damping, tol, maxIter)
+                        }
+            country = np.flatnonzero(present)
+            table   = dict( (name, values[country]) for name, values in table.items() )
+            table["Country"] = np.asarray(self.countries, dtype=object)[country]
+            table["Year"]    = np.full(len(country), year, dtype=np.int16)
+            tables.append( pd.DataFrame(table, columns=["Year", "Country"] + metrics) )
+        
+        if not tables:
+            return pd.DataFrame(columns=["Year", "Country"] + metrics)
+        return pd.concat(tables, ignore_index=True)
+
+    def inflows(self, destination):
+        """
+        The values of all origins summed up for each year, i.e. the same as
+        grouping the rows of the destination by year. Only the years with
+        data for the destination are returned.
+        """
+        return self._sum(destination, "destination")
+
+    def outflows(self, origin):
+        """ The values of all destinations summed up, see inflows() """
+        return self._sum(origin, "origin")
+
+    def corridor(self, destination, origin):
+        """
+        The values of one destination and origin for each year. Only the
+        years with data are returned, values that are not known are NaN.
+        """
+        i, j = self.index.get(destination), self.index.get(origin)
+        result = { "Year": list() }
+        result.update( (column, list()) for column in self.columns )
+        if i is None or j is None:
+            return pd.DataFrame(result, columns=["Year"] + self.columns)
+
+        for year in self.years:
+            if self.records[year][i,j] == 0:
+                continue
+            result["Year"].append(year)
+            for column in self.columns:
+                known = self.known[column, year][i,j] > 0
+                result[column].append( self.values[column, year][i,j] if known else np.nan )
+        return pd.DataFrame(result, columns=["Year"] + self.columns)
+
+    def partners(self, country, column, year, n=10, by="destination"):
+        """
+        The n largest partners of a country in one year.
+
+        Input:
+          by (str):  "destination" gives the largest origins of the country,
+                     "origin" the largest destinations
+
+        Output:
+          partners (pd.Series):  The values indexed by the partner countries
+        """
+        i = self.index.get(country)
+        if i is None:
+            return pd.Series(dtype=np.float64)
+        partner, values = self._entries(self.values[column, year], (column, year), i, by)
+        order = np.argsort(-values, kind="stable")[:n]
+        return pd.Series( values[order], index=[ self.countries[k] for k in partner[order] ] )
+
+    def _entries(self, matrix, key, i, by):
+        """
+        The non-zero entries of row i (by="destination") or column i
+        (by="origin") of matrix as (partners, values). The column major
+        copies are created once and kept with key.
+        """
+        if by != "destination":
+            if key not in self._csc:
+                self._csc[key] = matrix.tocsc()
+            matrix = self._csc[key]
+        start, end = matrix.indptr[i], matrix.indptr[i+1]
+        return matrix.indices[start:end], matrix.data[start:end]
+
+    def _sum(self, country, by):
+        """ Sum the entries of the country for each year, see inflows() """
+        i = self.index.get(country)
+        result = { "Year": list() }
+        result.update( (column, list()) for column in self.columns )
+        if i is None:
+            return pd.DataFrame(result, columns=["Year"] + self.columns)
+
+        for year in self.years:
+            partners, _ = self._entries(self.records[year], ("records", year), i, by)
+            if len(partners) == 0:
+                continue
+            result["Year"].append(year)
+            for column in self.columns:
+                result[column].append( self._entries(self.values[column, year], (column, year), i, by)[1].sum() )
+        return pd.DataFrame(result, columns=["Year"] + self.columns)
+
+
+def _topSum(matrix, k):
+    """ Sum of the k largest entries of each row of the CSR matrix """
+    rows   = np.repeat( np.arange(matrix.shape[0]), np.diff(matrix.indptr) )
+    order  = np.lexsort( (-matrix.data, rows) )
+    rank   = np.arange(len(order)) - matrix.indptr[ rows[order] ] # rank within the row
+    top    = order[ rank < k ]
+    return np.bincount( rows[top], weights=matrix.data[top], minlength=matrix.shape[0] )
+
+
+def _pageRank(matrix, present, damping, tol, maxIter):
+    """
+    PageRank of the graph with the edges j -> i weighted by matrix[i,j]. The
+    rank of countries without outgoing flows (and of the random jumps) is
+    spread over the present countries. The ranks of the present countries
+    sum up to one, the others are NaN.
+    """
+    n = present.sum()
+    rank = np.full(matrix.shape[0], np.nan)
+    if n == 0:
+        return rank
+    
+    outStrength = np.asarray( matrix.sum(axis=0) ).ravel()
+    dangling    = present & (outStrength <= 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scale = np.where(outStrength > 0, 1. / outStrength, 0.)
+    transition = matrix @ sparse.diags(scale) # column stochastic for j with out flows
+    
+    rank = np.where(present, 1. / n, 0.)
+    for _ in range(maxIter):
+        new  = damping * (transition @ rank)
+        new += np.where( present, ( damping * rank[dangling].sum() + (1 - damping) ) / n, 0. )
+        change = np.abs(new - rank).sum()
+        rank   = new
+        if change < tol:
+            break
+    return np.where(present, rank, np.nan)
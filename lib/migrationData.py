@@ -24,9 +24,11 @@ with this program; if not, write to the Free Software Foundation, Inc.,
 
 """
 import numpy as np
+import pandas as pd
 import matplotlib.pyplot as plt
 
 from countryCodeMapper import CountryCodeMapper
+from flowMatrix import FlowMatrix
 from utils import Settings, splitNA, plotWithNA
 
 
@@ -40,10 +42,72 @@ class Migration(Settings):
         
         self.destination_ID     = None
         self.origin_ID          = None
+        self._data              = None
+        self._flows             = None # see flows
+        self._totals            = None # see totals
+
+    @property
+    def data(self):
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        """
+        Set the data. The flows and totals derived from it are computed
+        again the next time they are used. (Modify the data by assigning a
+        new DataFrame, changes in place are not noticed.)
+        """
+        self._data   = data
+        self._flows  = None
+        self._totals = None
+
+    @property
+    def flows(self):
+        """ The data as sparse origin-destination matrices (see FlowMatrix) """
+        if self._flows is None:
+            self._flows = FlowMatrix(self.data, self.destination_ID, self.origin_ID)
+        return self._flows
+
+    @property
+    def totals(self):
+        """
+        The values summed up by year for each destination and for each
+        origin, i.e. totals[self.destination_ID][country] is a DataFrame with
+        the columns Year and the value columns. Computed once for all
+        countries (see FlowMatrix.aggregate()).
+        """
+        if self._totals is None:
+            self._totals = dict()
+            for column, by in ( (self.destination_ID, "destination"), (self.origin_ID, "origin") ):
+                aggregate = self.flows.aggregate(by)
+                self._totals[column] = dict( (country, table.drop(columns="Country").reset_index(drop=True)) \
+                                             for country, table in aggregate.groupby("Country", sort=False) )
+        return self._totals
+
+    def network(self, column, **kwargs):
+        """
+        Network metrics (e.g. PageRank) of each country and year for one
+        value column. Returns a DataFrame with the columns Year, Country and
+        the metrics, see FlowMatrix.network() for the metrics and options.
+        """
+        return self.flows.network(column, **kwargs)
 
     def _loadData(self, fname):
         raise NotImplementedError
 
+    def _unknown(self, column):
+        """
+        Set the countries that are not understood by the mapper (or missing)
+        to "Various/Unknown". Only the categories of the column are looked up.
+        """
+        column = pd.Categorical(column)
+        known  = pd.notnull( self.mapper.convert(column.categories) )
+        names  = np.append( np.where(known, np.asarray(column.categories, dtype=object), "Various/Unknown"), "Various/Unknown" )
+        categories, inverse = np.unique( names.astype(str), return_inverse=True )
+        codes  = np.where( column.codes >= 0, column.codes, len(names)-1 )
+        return pd.Categorical.from_codes( inverse[codes], categories ).remove_unused_categories()
+
+
     def show(self, destination_country=None, origin_country=None, year=None):
         """
         Plot summaries of the migration data
@@ -138,8 +202,7 @@ class Migration(Settings):
         assert( self.destination_ID is not None )
         assert( self.origin_ID      is not None )
         # Get the numbers for the rates between these two countries
-        tmpData = self.data[ self.data[self.destination_ID] == destination_country ] 
-        tmpData = tmpData[ tmpData[self.origin_ID] == origin_country ]
+        tmpData = self.flows.corridor(destination_country, origin_country)
         
         # Get the individual data
         x, Y = self._extract(tmpData)
@@ -163,11 +226,10 @@ class Migration(Settings):
         assert( self.destination_ID is not None )
         assert( self.origin_ID      is not None )
 
-        tmpData = self.data[ self.data[column] == country ]
-        del tmpData[self.destination_ID]
-        del tmpData[self.origin_ID]
-        tmpData = tmpData.groupby(["Year"], sort=True).agg([np.sum]).reset_index()
-        tmpData.columns = tmpData.columns.droplevel(1)
+        # Sum up all partners of the country for each year
+        tmpData = self.totals[column].get(country)
+        if tmpData is None:
+            tmpData = pd.DataFrame(columns=["Year"] + self.flows.columns)
         return tmpData
 
     def _extract(self, dataFrame):
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+
+The extreme months of the climate data (see climateData.py) as bitmasks.
+
+WeatherData counts the extreme months of each country, year and element
+(0-12). The MonthMasks keep which months were extreme, one uint16 per
+country, year and element: bit m-1 is set if month m was extreme. Bit 15
+(NO_DATA) is set if there was no data for the year at all. E.g.
+
+    masks = WeatherData(...).masks
+    masks.count()                  # the same values as WeatherData.data
+    masks.count(SEASONS["JJA"])    # extreme summer months
+    masks.extreme(7)               # True if July was extreme
+
+----
+
+Copyright (C) 2015  Niklas Berliner
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+import numpy as np
+import pandas as pd
+
+
+NO_DATA = np.uint16(1 << 15)
+MONTHS  = np.uint16(0x0FFF)
+
+# The months of the (meteorological) seasons of the northern hemisphere.
+# December is taken from the same year, i.e. not the one before January.
+SEASONS = { "DJF" : [12, 1, 2]  ,\
+            "MAM" : [3, 4, 5]   ,\
+            "JJA" : [6, 7, 8]   ,\
+            "SON" : [9, 10, 11]
+          }
+
+
+def monthMask(months):
+    """ The mask of the months (1-12), e.g. monthMask([6, 7, 8]) """
+    mask = 0
+    for month in np.atleast_1d(months):
+        if not 1 <= month <= 12:
+            raise ValueError("Month %r is not within 1-12" %month)
+        mask |= 1 << (int(month) - 1)
+    return np.uint16(mask)
+
+
+def popcount(masks):
+    """ The number of months set in each mask (the NO_DATA bit is ignored) """
+    x = np.asarray(masks, dtype=np.uint16) & MONTHS
+    x = x - ( (x >> 1) & np.uint16(0x5555) )
+    x = ( x & np.uint16(0x3333) ) + ( (x >> 2) & np.uint16(0x3333) )
+    x = ( x + (x >> 4) ) & np.uint16(0x0F0F)
+    return ( ( x + (x >> 8) ) & np.uint16(0x001F) ).astype(np.uint8)
+
+
+class MonthMasks(object):
+
+    def __init__(self, countries, years, elements, masks):
+        """
+        Input:
+          countries (list):  The countries (first axis)
+
+          years (list):      The years (second axis)
+
+          elements (list):   The elements (third axis)
+
+          masks (np.array):  uint16 (countries x years x elements)
+        """
+        self.countries = list(countries)
+        self.years     = np.asarray(years, dtype=np.int16)
+        self.elements  = list(elements)
+        self.masks     = np.asarray(masks, dtype=np.uint16)
+
+    def __repr__(self):
+        return "MonthMasks Object: %d countries; %d years; Elements: %r" %(len(self.countries), len(self.years), self.elements)
+
+    @property
+    def known(self):
+        """ True if there was data for the country, year and element """
+        return (self.masks & NO_DATA) == 0
+
+    def count(self, months=None):
+        """
+        The number of extreme months, NaN if there was no data.
+
+        Input:
+          months (list):  Only count these months (1-12), all if None
+        """
+        masks = self.masks if months is None else self.masks & monthMask(months)
+        return np.where(self.known, popcount(masks), np.nan)
+
+    def season(self, name):
+        """ The number of extreme months of a season, see SEASONS """
+        return self.count(SEASONS[name])
+
+    def extreme(self, month):
+        """ True if the month (1-12) was extreme """
+        return (self.masks & monthMask(month)) != 0
+
+    def between(self, first=None, last=None):
+        """ The masks of the years first to last (both included) """
+        keep = np.ones(len(self.years), dtype=bool)
+        if first is not None:
+            keep &= self.years >= first
+        if last is not None:
+            keep &= self.years <= last
+        return MonthMasks(self.countries, self.years[keep], self.elements, self.masks[:,keep])
+
+    def frame(self, values=None):
+        """
+        Create a DataFrame with the columns Country, Year and one per element
+        from values (countries x years x elements), e.g. frame(masks.count()).
+        Defaults to the masks. Only the years with data are kept (the same
+        rows as WeatherData.data).
+        """
+        if values is None:
+            values = self.masks
+        country, year = np.nonzero( self.known.any(axis=2) )
+
+        result = pd.DataFrame( {"Country": np.asarray(self.countries, dtype=object)[country] ,\
+                                "Year"   : self.years[year]                                 ,\
+                               }, columns=["Country", "Year"] )
+        for i, name in enumerate(self.elements):
+            result[name] = values[country, year, i]
+        return result
+
+    @classmethod
+    def fromFrame(cls, dataFrame, elements):
+        """ Create the masks from a DataFrame created with frame() """
+        countries, country = np.unique( np.asarray(dataFrame["Country"], dtype=str), return_inverse=True )
+        years, year        = np.unique( np.asarray(dataFrame["Year"]), return_inverse=True )
+
+        masks = np.full( (len(countries), len(years), len(elements)), NO_DATA, dtype=np.uint16 )
+        for i, name in enumerate(elements):
+            masks[country, year, i] = dataFrame[name]
+        return cls(countries, years, elements, masks)
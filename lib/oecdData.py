@@ -30,6 +30,17 @@ import zipfile
 from migrationData import Migration
 
 
+# Origins that sum up other origins of the table (the total and regions)
+AGGREGATES = [ "Total"                                  ,\
+               "European Union (15)"                    ,\
+               "European Economic Area"                 ,\
+               "Central and Eastern European Countries" ,\
+               "Baltic states"                          ,\
+               "Caribbean"                              ,\
+               "Caribbean and Guyana"
+             ]
+
+
 class OECDdata(Migration):
     
     def __init__(self, fname):
@@ -69,6 +80,9 @@ class OECDdata(Migration):
         # I do not know what these mean and prefer to remove them for now.
         data = data[ data["Flags"].isnull() ]
         
+        # The aggregates would count the migrants twice
+        data = data[ ~data["Country of origin"].isin(AGGREGATES) ]
+        
         # We will drop some columns and reorder them. Then we can "pivot" the table.
         # This will take the "Variable" column, take it as an index for new
         # columns, and will put the "Value" entry as value in its place.
@@ -78,12 +92,20 @@ class OECDdata(Migration):
                                 values="Value"
                                )
         data.reset_index(inplace=True)
+        variables = [ name for name in data.columns if name not in ("Year", "Country", "Country of origin") ]
+        
+        # The origins that are not present in the country mapper (e.g.
+        # "Stateless", "Former USSR" or "Not stated") are subsumed as
+        # "Various/Unknown", like in the UNHCR data.
+        data["Country"] = self._unknown(data["Country"])
+        data["Origin"]  = self._unknown(data["Country of origin"])
+        del data["Country of origin"]
+        data = data.groupby(["Year", "Country", "Origin"], observed=True, sort=True)[variables].sum(min_count=1).reset_index()
+        data = data[ ["Year", "Country"] + variables + ["Origin"] ]
         
         # Convert the country columns into the three letter country code
-        # and rename column "Country of origin" to "Origin"
         data["Country"] = self.mapper.convert( data["Country"] )
-        data["Origin"]  = self.mapper.convert( data["Country of origin"] )
-        del data["Country of origin"]
+        data["Origin"]  = self.mapper.convert( data["Origin"] )
         
         return data
 
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+
+Binary cache for DataFrames that are expensive to build.
+
+Each table is stored in its own folder with one .npy file per column and a
+json file describing the columns. Loading maps the .npy files into memory
+instead of parsing them, i.e. a warm load costs (almost) nothing. The
+tables are keyed by the parameters they were built with, i.e. tables built
+with different parameters coexist.
+
+----
+
+Copyright (C) 2015  Niklas Berliner
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+
+
+class TableCache(object):
+
+    def __init__(self, folder):
+        """
+        Cache DataFrames in folder.
+
+        Input:
+          folder (str):  The cache folder, it is created if needed
+        """
+        self.folder = folder
+
+        # The content hashes of the input files, see fileHash()
+        self.fnameHashes = os.path.join(folder, "hashes.json")
+
+    def key(self, **params):
+        """
+        Get the key of a table built with params. The parameters must be
+        json serialisable, the order of the keyword arguments does not matter.
+        """
+        params = json.dumps(params, sort_keys=True, default=list)
+        return hashlib.sha1( params.encode("utf-8") ).hexdigest()[:16]
+
+    def fileHash(self, fname):
+        """
+        Get the sha1 hash of the content of fname.
+
+        The hash of a file is remembered together with its size and
+        modification time, i.e. a file is only read again once it changed.
+        """
+        stat   = os.stat(fname)
+        hashes = self._loadHashes()
+        entry  = hashes.get( os.path.abspath(fname) )
+        if entry is not None and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            return entry["sha1"]
+
+        sha1 = hashlib.sha1()
+        with open(fname, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha1.update(block)
+
+        hashes[ os.path.abspath(fname) ] = { "size"  : stat.st_size    ,\
+                                             "mtime" : stat.st_mtime   ,\
+                                             "sha1"  : sha1.hexdigest()
+                                           }
+        self._saveHashes(hashes)
+        return sha1.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.folder, key)
+
+    def __contains__(self, key):
+        return os.path.isfile( os.path.join(self.path(key), "table.json") )
+
+    def load(self, key):
+        """
+        Load the table stored with key. The numeric columns are memory
+        mapped (read-only). Returns None if there is no such table.
+        """
+        if key not in self:
+            return None
+
+        path = self.path(key)
+        with open(os.path.join(path, "table.json"), 'r') as f:
+            meta = json.load(f)
+
+        columns = dict()
+        for i, column in enumerate(meta["columns"]):
+            values = np.load(os.path.join(path, "%d.npy" %i), mmap_mode='r').view(np.ndarray) # still mapped
+            if column["categories"] is not None:
+                values = pd.Categorical.from_codes(values, column["categories"])
+                if column.get("dtype", "category") != "category": # e.g. a column of strings
+                    values = pd.Series(values).astype(column["dtype"])
+            columns[column["name"]] = values
+        return pd.DataFrame(columns, columns=[ column["name"] for column in meta["columns"] ], copy=False)
+
+    def save(self, key, dataFrame, params=None):
+        """
+        Store dataFrame with key. Columns of strings (or other objects) are
+        stored as categoricals, i.e. as integer codes and the categories,
+        and converted back to their dtype when loading.
+        The parameters are kept in the json file for reference.
+        """
+        path = self.path(key)
+        temp = path + ".tmp"
+        if os.path.isdir(temp):
+            shutil.rmtree(temp)
+        os.makedirs(temp)
+
+        meta = { "params": params, "columns": list() }
+        for i, name in enumerate(dataFrame.columns):
+            values     = dataFrame[name]
+            categories = None
+            dtype      = str(values.dtype)
+            if not ( isinstance(values.dtype, pd.CategoricalDtype) or pd.api.types.is_numeric_dtype(values.dtype) ):
+                values = values.astype("category")
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                categories = [ str(category) for category in values.cat.categories ]
+                values     = values.cat.codes
+            np.save(os.path.join(temp, "%d.npy" %i), np.ascontiguousarray(values.values))
+            meta["columns"].append( {"name": str(name), "categories": categories, "dtype": dtype} )
+
+        with open(os.path.join(temp, "table.json"), 'w') as f:
+            json.dump(meta, f, indent=1, sort_keys=True)
+
+        # Replace an older copy only once the new one is complete
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.replace(temp, path)
+        return path
+
+    def _loadHashes(self):
+        if not os.path.isfile(self.fnameHashes):
+            return dict()
+        with open(self.fnameHashes, 'r') as f:
+            return json.load(f)
+
+    def _saveHashes(self, hashes):
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder, exist_ok=True)
+        # Readers (e.g. other shards) never see a partly written file
+        temp = "%s.%d.tmp" %(self.fnameHashes, os.getpid())
+        with open(temp, 'w') as f:
+            json.dump(hashes, f, indent=1, sort_keys=True)
+        os.replace(temp, self.fnameHashes)
@@ -24,92 +24,106 @@ with this program; if not, write to the Free Software Foundation, Inc.,
 """
 import pandas as pd
 import numpy as np
+from pandas.api.types import union_categoricals
 
 from migrationData import Migration
 
 
 
+# The numeric columns of the UNHCR export
+COLUMNS = [ "Refugees (incl. refugee-like situations)" ,\
+            "Asylum-seekers (pending cases)"           ,\
+            "Returned refugees"                        ,\
+            "Internally displaced persons (IDPs)"      ,\
+            "Returned IDPs"                            ,\
+            "Stateless persons"                        ,\
+            "Others of concern"                        ,\
+            "Total Population"
+          ]
+
+
 class UNHCRdata(Migration):
     
-    def __init__(self, fname):
+    def __init__(self, fname, chunksize=None):
+        """
+        Container for the UNHCR persons of concern export.
+        
+        Input:
+          fname (str):      Location of the UNHCR .csv export
+          
+          chunksize (int):  Number of rows that are read at once, None reads
+                            the whole file at once. Only the rows from
+                            yearLimit on are kept of each chunk.
+        """
         super(UNHCRdata, self).__init__(fname)
 
         self.destination_ID = "Country"
         self.origin_ID      = "Origin"
+        self.chunksize      = chunksize
+        self.yearLimit      = 1980 # only data from here on is taken
         
         self.data = self._loadData(fname)
         
     
     def _loadData(self, fname):
-        # The data contains non-number characters and will be loaded as string
-        dtype = {"Year"                                     : np.int ,\
-                 "Country / territory of asylum/residence"  : str    ,\
-                 "Origin"                                   : str    ,\
-                 "Refugees (incl. refugee-like situations)" : str    ,\
-                 "Asylum-seekers (pending cases)"           : str    ,\
-                 "Returned refugees"                        : str    ,\
-                 "Internally displaced persons (IDPs)"      : str    ,\
-                 "Returned IDPs"                            : str    ,\
-                 "Stateless persons"                        : str    ,\
-                 "Others of concern"                        : str    ,\
-                 "Total Population"                         : str
-                 }
-        data = pd.read_csv(fname, skiprows=2, header=0, dtype=dtype)
-        
-        # Drop everything before 1980
-        data = data[ (data["Year"]) >= 1980 ]
-        
-        # The UNHCR database contains redacted values marked by "*"
-        # They note "A number of statistics are not shown in this system but 
-        # are displayed as asterisks (*). These represent situations where the 
-        # figures are being kept confidential to protect the anonymity of persons
-        # of concern. Note that such figures are not included in any totals."
-        data.replace("*", np.NaN, inplace=True)
-        # Set the column type to float
-        data["Refugees (incl. refugee-like situations)"] = data["Refugees (incl. refugee-like situations)"].astype(float)
-        data["Asylum-seekers (pending cases)"]           = data["Asylum-seekers (pending cases)"].astype(float)
-        data["Returned refugees"]                        = data["Returned refugees"].astype(float)
-        data["Internally displaced persons (IDPs)"]      = data["Internally displaced persons (IDPs)"].astype(float)
-        data["Returned IDPs"]                            = data["Returned IDPs"].astype(float)
-        data["Stateless persons"]                        = data["Stateless persons"].astype(float)
-        data["Others of concern"]                        = data["Others of concern"].astype(float)
-        data["Total Population"]                         = data["Total Population"].astype(float)
-
-        # Set the column names; rename "Country / territory of asylum/residence" to "Country"
-        index = ["Year","Country"]
-        index.extend(data.columns[2:])
-        data.columns = index
+        data = self._read(fname)
 
         # The data contains countries that are not present in country mapper
-        # or are not specified. We will subsume them as "Various/Unknown"
-        
-        # First we will take all destination countries that are not recognised
-        # and create a single new entry for them.
-        idx = self.mapper.convert( data["Country"] )
-        idx = np.where( idx=="False" )[0] # I do not know why I have to compare it to the string "False"
-        data.iloc[idx,1] = "Various/Unknown" # this overwrites the "Country"
-                                             # columns of all rows with non understood countries.
-
-        # In the next step we can group by the destination country and combine
-        # the unknown origin countries into a single entry
-        # We start by setting the entries that are not understood to "Various/Unknown"
-        idx = self.mapper.convert( data["Origin"] )
-        idx = np.where( idx=="False" )[0]
-        data.iloc[idx,2] = "Various/Unknown"
-        # Now group by destination and origin country and create aggregates
-        data = data.groupby(["Year","Country", "Origin"]).agg([np.sum]).reset_index()
-        data.reset_index()
-        data.columns = data.columns.droplevel(1) # The columns names are multiindexes
-                                                 # containing the information about the
-                                                 # aggregation function used to collapse
-                                                 # the rows. We need to drop that
-                                                 # See: http://stackoverflow.com/a/22233719
+        # or are not specified. We will subsume them as "Various/Unknown".
+        data["Country"] = self._unknown(data["Country"])
+        data["Origin"]  = self._unknown(data["Origin"])
+
+        # Now group by destination and origin country and create aggregates.
+        # The totals exceed the integers float32 can hold exactly, i.e. the
+        # values are summed (and kept) as float64 like the other sources.
+        data[COLUMNS] = data[COLUMNS].astype(np.float64)
+        data = data.groupby(["Year","Country", "Origin"], observed=True, sort=True)[COLUMNS].sum().reset_index()
         
         # Convert the country columns into the three letter country code
         data["Country"] = self.mapper.convert( data["Country"] )
         data["Origin"]  = self.mapper.convert( data["Origin"] )
         return data
 
+    def _read(self, fname):
+        """
+        Read the export in one pass. The numbers are read as float32 and
+        the countries as categoricals. The rows before yearLimit are dropped
+        while reading, i.e. with a chunksize only the kept rows of the chunks
+        are held in memory.
+        
+        The UNHCR database contains redacted values marked by "*". They note
+        "A number of statistics are not shown in this system but are
+        displayed as asterisks (*). These represent situations where the
+        figures are being kept confidential to protect the anonymity of
+        persons of concern. Note that such figures are not included in any
+        totals." They are read as NaN.
+        """
+        dtype = {"Year"                                    : np.int16 ,\
+                 "Country / territory of asylum/residence" : str      ,\
+                 "Origin"                                  : str      }
+        dtype.update( (column, np.float32) for column in COLUMNS )
+        
+        reader = pd.read_csv(fname, skiprows=2, header=0, dtype=dtype, na_values=["*"], chunksize=self.chunksize)
+        chunks = [reader] if self.chunksize is None else reader
+        
+        columns = list()
+        for chunk in chunks:
+            # Rename "Country / territory of asylum/residence" to "Country"
+            chunk = chunk.rename(columns={"Country / territory of asylum/residence": "Country"})
+            chunk = chunk[ chunk["Year"] >= self.yearLimit ]
+            columns.append( { "Year"    : chunk["Year"].values                   ,\
+                              "Country" : pd.Categorical(chunk["Country"].values) ,\
+                              "Origin"  : pd.Categorical(chunk["Origin"].values)  ,\
+                            } )
+            columns[-1].update( (column, chunk[column].values) for column in COLUMNS )
+        
+        data = dict()
+        for name in ["Year", "Country", "Origin"] + COLUMNS:
+            if name in ("Country", "Origin"):
+                data[name] = union_categoricals([ chunk[name] for chunk in columns ])
+            else:
+                data[name] = np.concatenate([ chunk[name] for chunk in columns ])
+        return pd.DataFrame(data, columns=["Year", "Country", "Origin"] + COLUMNS)
 
     def _showYear(self, year):
         pass
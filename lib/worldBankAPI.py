@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+
+Download World Bank indicators from the World Bank API (v2).
+
+The indicators are written into the data/world-bank folder in the same
+format as the files downloaded from http://data.worldbank.org/indicator,
+i.e. they can be loaded with WorldBankData.
+
+----
+
+Copyright (C) 2015  Niklas Berliner
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+import io
+import os
+import csv
+import json
+import zipfile
+import threading
+import http.client
+from urllib.parse import urlsplit, urlencode
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+class WorldBankAPI(object):
+
+    def __init__(self, folder="../data/world-bank/"        ,\
+                       url="https://api.worldbank.org/v2"  ,\
+                       workers=8                           ,\
+                       perPage=1000                        ,\
+                       timeout=60
+                ):
+        """
+        Download World Bank indicators using the World Bank API.
+
+        The requests are spread over a pool of worker threads, each of them
+        keeping its own connection to the server alive. The first page of
+        each indicator is requested conditionally (ETag/Last-Modified), i.e.
+        an indicator that did not change since the last download costs one
+        "304 Not Modified" response. The remaining pages of an indicator
+        are requested in parallel.
+
+        Input:
+          folder (str):    The folder the indicator files are written to
+
+          url (str):       The base url of the API
+
+          workers (int):   Number of parallel connections
+
+          perPage (int):   Number of entries requested per page
+
+          timeout (float): Timeout of each request in seconds
+        """
+        self.folder  = folder
+        self.url     = url.rstrip('/')
+        self.workers = workers
+        self.perPage = perPage
+        self.timeout = timeout
+
+        # The validators (ETag/Last-Modified) of the previous downloads
+        self.fnameCache = os.path.join(folder, ".worldbank-api.json")
+        self.cache      = self._loadCache()
+
+        self._local       = threading.local() # one connection per worker thread
+        self._connections = set()             # the open connections of all threads
+        self._lock        = threading.Lock()
+
+    def __call__(self, indicators):
+        """ See update() """
+        return self.update(indicators)
+
+    def update(self, indicators):
+        """
+        Download the indicators and write them into the folder.
+
+        Indicators that did not change since the last download are not
+        written again. Returns a dict mapping each indicator code to either
+        "updated", "unchanged" or "failed".
+
+        Input:
+          indicators (list):  List of World Bank indicator codes
+
+        """
+        if isinstance(indicators, str):
+            indicators = [indicators, ]
+        indicators = [ code.upper() for code in indicators ]
+
+        status  = dict()
+        pages   = dict() # indicator -> {page: entries}
+        headers = dict() # indicator -> validators of the first page
+        updated = dict() # indicator -> date of the last update
+        try:
+            self._download(indicators, status, pages, headers, updated)
+        finally:
+            self.closeAll() # the worker threads are gone, close their connections
+
+        # Write the completely downloaded indicators
+        for code in pages:
+            if status.get(code) == "failed":
+                continue
+            entries = [ entry for page in sorted(pages[code]) for entry in pages[code][page] ]
+            self._write(code, entries, updated[code])
+            self.cache[code] = headers[code]
+            status[code] = "updated"
+
+        self._saveCache()
+        return status
+
+    def _download(self, indicators, status, pages, headers, updated):
+        """ Request all pages of the indicators, see update() """
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            # Request the first page of each indicator. It tells us if the
+            # indicator changed and how many pages there are.
+            first = { pool.submit(self._request, code, 1, True): code for code in indicators }
+
+            rest = dict()
+            for future in as_completed(first):
+                code = first[future]
+                try:
+                    response = future.result()
+                except Exception as error:
+                    print("Could not download indicator %s: %s" %(code, error))
+                    status[code] = "failed"
+                    continue
+
+                if response["status"] == 304:
+                    status[code] = "unchanged"
+                    continue
+
+                header, entries = response["data"]
+                pages[code]   = { 1: entries }
+                headers[code] = response["validators"]
+                updated[code] = header.get("lastupdated", "")
+                for page in range(2, int(header["pages"])+1):
+                    rest[ pool.submit(self._request, code, page, False) ] = (code, page)
+
+            # Collect the remaining pages
+            for future in as_completed(rest):
+                code, page = rest[future]
+                try:
+                    response = future.result()
+                except Exception as error:
+                    print("Could not download page %d of indicator %s: %s" %(page, code, error))
+                    status[code] = "failed"
+                    continue
+                pages[code][page] = response["data"][1]
+
+    def close(self):
+        """ Close the connection of the calling thread. """
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+            with self._lock:
+                self._connections.discard(connection)
+
+    def closeAll(self):
+        """ Close the connections of all threads. """
+        with self._lock:
+            connections, self._connections = self._connections, set()
+        for connection in connections:
+            connection.close()
+        self._local.connection = None
+
+    def fname(self, indicator):
+        """ The filename used for the indicator. Mirrors the World Bank downloads. """
+        return os.path.join(self.folder, "%s_Indicator_en_csv_v2.zip" %indicator.lower())
+
+    def _connection(self):
+        """ Get the keep-alive connection of the calling thread. """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            url = urlsplit(self.url)
+            if url.scheme == "https":
+                connection = http.client.HTTPSConnection(url.netloc, timeout=self.timeout)
+            else:
+                connection = http.client.HTTPConnection(url.netloc, timeout=self.timeout)
+            self._local.connection = connection
+            with self._lock:
+                self._connections.add(connection)
+        return connection
+
+    def _request(self, indicator, page, conditional):
+        """
+        Request one page of the indicator. The request is retried once on
+        a fresh connection if the kept alive connection was closed by the
+        server or timed out.
+        """
+        path  = urlsplit(self.url).path
+        query = urlencode( {"format": "json", "per_page": self.perPage, "page": page} )
+        path  = "%s/country/all/indicator/%s?%s" %(path, indicator, query)
+
+        headers = { "Accept": "application/json", "Connection": "keep-alive" }
+        if conditional and indicator in self.cache and os.path.isfile(self.fname(indicator)):
+            validators = self.cache[indicator]
+            if validators.get("ETag"):
+                headers["If-None-Match"] = validators["ETag"]
+            if validators.get("Last-Modified"):
+                headers["If-Modified-Since"] = validators["Last-Modified"]
+
+        for attempt in range(2):
+            connection = self._connection()
+            try:
+                connection.request("GET", path, headers=headers)
+                response = connection.getresponse()
+                body     = response.read() # must be read to reuse the connection
+            except (http.client.HTTPException, OSError): # e.g. closed or timed out
+                self.close() # the connection is broken, drop it
+                if attempt == 1:
+                    raise
+                continue
+            break
+
+        if response.getheader("Connection", "").lower() == "close":
+            self.close()
+
+        if response.status == 304:
+            return { "status": 304 }
+        if response.status != 200:
+            raise IOError("HTTP status %d" %response.status)
+
+        data = json.loads(body.decode("utf-8"))
+        # The API reports errors with status 200 and a message instead of data
+        if len(data) < 2 or "message" in data[0]:
+            raise IOError("Indicator not understood by the API: %r" %data[0])
+        if data[1] is None:
+            data[1] = list()
+
+        validators = { "ETag"          : response.getheader("ETag")          ,\
+                       "Last-Modified" : response.getheader("Last-Modified")
+                     }
+        return { "status": 200, "data": data, "validators": validators }
+
+    def _write(self, indicator, entries, lastUpdated=""):
+        """
+        Write the indicator into a zipfile that can be read by WorldBankData.
+
+        The file contains the data table with one row per country and one
+        column per year and the indicator metadata.
+        """
+        name  = indicator
+        table = dict()
+        for entry in entries:
+            country = entry.get("countryiso3code") or ""
+            if len(country) != 3:
+                continue
+            name = entry["indicator"]["value"]
+            row  = table.setdefault(country, {"Country Name": entry["country"]["value"]})
+            if entry["value"] is not None:
+                row[entry["date"]] = entry["value"]
+
+        years = sorted( set( key for row in table.values() for key in row if key.isdigit() ) )
+
+        data = io.StringIO()
+        data.write('"Data Source","World Development Indicators",\r\n\r\n')
+        data.write('"Last Updated Date","%s",\r\n\r\n' %lastUpdated)
+        writer = csv.writer(data, quoting=csv.QUOTE_ALL, lineterminator="\r\n")
+        writer.writerow( ["Country Name", "Country Code", "Indicator Name", "Indicator Code"] + years )
+        for country in sorted(table):
+            row = table[country]
+            writer.writerow( [row["Country Name"], country, name, indicator] + \
+                             [ row.get(year, "") for year in years ] )
+
+        metadata = io.StringIO()
+        writer = csv.writer(metadata, quoting=csv.QUOTE_ALL, lineterminator="\r\n")
+        writer.writerow( ["INDICATOR_CODE", "INDICATOR_NAME", "SOURCE_NOTE", "SOURCE_ORGANIZATION"] )
+        writer.writerow( [indicator, name, "", ""] )
+
+        # Write to a temporary file first, a failed download must not leave
+        # a broken file behind.
+        fname = self.fname(indicator)
+        base  = os.path.split(fname)[1][:-4]
+        with zipfile.ZipFile(fname + ".tmp", "w", zipfile.ZIP_DEFLATED) as f:
+            f.writestr("Metadata_Indicator_%s.csv" %base, metadata.getvalue())
+            f.writestr("%s.csv" %base, data.getvalue())
+        os.replace(fname + ".tmp", fname)
+        return fname
+
+    def _loadCache(self):
+        if not os.path.isfile(self.fnameCache):
+            return dict()
+        with open(self.fnameCache, 'r') as f:
+            return json.load(f)
+
+    def _saveCache(self):
+        with open(self.fnameCache, 'w') as f:
+            json.dump(self.cache, f, indent=1, sort_keys=True)
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+
+Local stand-in for the World Bank API (v2). Allows to use WorldBankAPI
+without a network connection, e.g.
+
+    with WorldBankStub({"NY.GDP.MKTP.CD": ("GDP (current US$)", rows)}) as url:
+        WorldBankAPI(folder, url=url)(["NY.GDP.MKTP.CD"])
+
+where rows is a list of (country code, country name, year, value) tuples.
+
+----
+
+Copyright (C) 2015  Niklas Berliner
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+import json
+import time
+import hashlib
+import threading
+from collections import Counter
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class WorldBankStub(object):
+
+    def __init__(self, indicators=None, host="127.0.0.1", port=0):
+        """
+        Serve indicators the same way the World Bank API does.
+
+        Only the requests used by WorldBankAPI are understood, i.e.
+        /v2/country/all/indicator/<code>?format=json&per_page=N&page=M
+        The responses carry an ETag and "304 Not Modified" is returned for
+        matching If-None-Match headers. All requests are counted in
+        self.requests (by status code) to allow checking what was sent,
+        self.connections and self.closed count the opened and closed
+        connections. Slow responses can be simulated by adding delays (in
+        seconds) to self.delays, one per request.
+
+        Input:
+          indicators (dict):  Maps the indicator code to (name, rows) with rows
+                              being a list of (country code, country name,
+                              year, value) tuples.
+
+          host (str):         Address the server binds to
+
+          port (int):         Port of the server, 0 picks a free port
+        """
+        self.indicators  = dict()
+        self.requests    = Counter()
+        self.connections = 0
+        self.closed      = 0
+        self.delays      = list()
+        self.lock        = threading.Lock()
+        self.server      = None
+        self.thread      = None
+        self.host        = host
+        self.port        = port
+
+        for code, (name, rows) in (indicators or dict()).items():
+            self.add(code, name, rows)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def add(self, code, name, rows):
+        """ Add (or replace) an indicator. Replacing changes its ETag. """
+        self.indicators[code.upper()] = (name, list(rows))
+
+    def etag(self, code):
+        name, rows = self.indicators[code]
+        return '"%s"' %hashlib.sha1( repr((name, rows)).encode("utf-8") ).hexdigest()
+
+    def start(self):
+        """ Start serving in a background thread. Returns the base url. """
+        class Handler(StubRequestHandler):
+            pass
+        Handler.stub = self
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return "http://%s:%d/v2" %self.server.server_address[:2]
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread.join()
+            self.server = None
+
+    def page(self, code, page, perPage):
+        """ Assemble one page of the API response. """
+        name, rows = self.indicators[code]
+        pages = max(1, (len(rows) + perPage - 1) // perPage)
+
+        header = { "page"        : page    ,\
+                   "pages"       : pages   ,\
+                   "per_page"    : perPage ,\
+                   "total"       : len(rows),\
+                   "lastupdated" : "2015-07-28"
+                 }
+        entries = [ { "indicator"       : {"id": code, "value": name}     ,\
+                      "country"         : {"id": country[:2], "value": countryName} ,\
+                      "countryiso3code" : country                         ,\
+                      "date"            : str(year)                       ,\
+                      "value"           : value                           ,\
+                      "unit"            : ""                              ,\
+                      "obs_status"      : ""                              ,\
+                      "decimal"         : 0
+                    } for country, countryName, year, value in rows[(page-1)*perPage:page*perPage] ]
+        return [header, entries]
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1" # keep the connections alive
+    stub             = None
+
+    def setup(self):
+        super(StubRequestHandler, self).setup()
+        with self.stub.lock:
+            self.stub.connections += 1
+
+    def finish(self):
+        super(StubRequestHandler, self).finish()
+        with self.stub.lock:
+            self.stub.closed += 1
+
+    def log_message(self, *args):
+        pass # keep quiet
+
+    def do_GET(self):
+        with self.stub.lock:
+            delay = self.stub.delays.pop(0) if self.stub.delays else 0
+        time.sleep(delay)
+        
+        url   = urlsplit(self.path)
+        parts = url.path.strip('/').split('/')
+        query = parse_qs(url.query)
+
+        if len(parts) != 5 or parts[:4] != ["v2", "country", "all", "indicator"]:
+            return self._send(404, None)
+
+        code = parts[4].upper()
+        if code not in self.stub.indicators:
+            message = [ {"message": [ {"id": "120", "key": "Invalid value",
+                                       "value": "The provided parameter value is not valid"} ]} ]
+            return self._send(200, message)
+
+        etag = self.stub.etag(code)
+        if self.headers.get("If-None-Match") == etag:
+            return self._send(304, None, etag)
+
+        page    = int(query.get("page",     ["1"])[0])
+        perPage = int(query.get("per_page", ["50"])[0])
+        return self._send(200, self.stub.page(code, page, perPage), etag)
+
+    def _send(self, status, data, etag=None):
+        with self.stub.lock:
+            self.stub.requests[status] += 1
+
+        body = b"" if data is None else json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        if etag is not None:
+            self.send_header("ETag", etag)
+        if status != 304:
+            self.send_header("Content-Type",   "application/json;charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(body)
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""
+The modules in lib/ import each other by their plain names.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib"))
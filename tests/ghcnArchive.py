@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+Write small synthetic GHCN archives (tar files of .dly station files).
+"""
+import io
+import tarfile
+
+import numpy as np
+
+
+def dly(stationID, years, elements, seed=0, missing=0.1):
+    """
+    The .dly file of a station with random daily values for each element
+    and month of the years (list of two integers).
+    """
+    rng   = np.random.RandomState(seed)
+    lines = list()
+    for year in range(years[0], years[1]+1):
+        for month in range(1, 13):
+            for i, element in enumerate(elements):
+                values = 100*i + rng.randint(-100, 100, size=31)
+                values[ rng.rand(31) < missing ] = -9999
+                days   = "".join( "%5d %s " %(value, "X" if rng.rand() < 0.01 else " ") for value in values )
+                lines.append( "%-11s%04d%02d%-4s%s" %(stationID, year, month, element, days) )
+    return "\n".join(lines) + "\n"
+
+
+def writeArchive(fname, stations, folder="ghcnd_gsn"):
+    """
+    Write the archive fname. stations maps the station IDs to the content
+    of their .dly file.
+    """
+    with tarfile.open(fname, 'w:gz') as tar:
+        for stationID, content in stations.items():
+            data   = content.encode()
+            member = tarfile.TarInfo("%s/%s.dly" %(folder, stationID))
+            member.size  = len(data)
+            member.mtime = 1400000000
+            tar.addfile(member, io.BytesIO(data))
+    return fname
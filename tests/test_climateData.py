@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Build the climate data from small synthetic station lists and archives.
+"""
+import os
+import shutil
+import tarfile
+
+import numpy as np
+import pandas as pd
+
+from climateData import WeatherData, WeatherStationMapper, StationCache
+from ghcnArchive import dly, writeArchive
+
+
+LOCATIONS = [ ("ATG", 17.1167, -61.7833) ,\
+              ("ATG", 17.1333, -61.7833) ,\
+              ("DEU", 52.5200,  13.4050)
+            ]
+STATIONS  = [ ("ACW00011604", 17.1167, -61.7833, 10.1, "ST JOHNS COOLIDGE FLD") ,\
+              ("GM000003342", 52.5200,  13.4050, 34.0, "BERLIN")                ,\
+              ("AYM00089664", -77.850, 166.6670, 24.0, "MCMURDO SOUND")         ,\
+              ("ACW00011647", 17.1333, -61.7833, 19.2, "ST JOHNS")              ,\
+              ("GM000010147", 52.5200,  13.4050, 48.0, "BERLIN-TEMPELHOF")      ,\
+              ("GME00102380", 52.5200,  13.4050, 51.0, "BERLIN-DAHLEM")
+            ]
+ELEMENTS  = ["PRCP", "TMAX", "TMIN"]
+
+
+def writeLocations(folder):
+    fname = folder.join("LatLon2Country.csv")
+    fname.write( "Country,Latitude,Longitude\n" + \
+                 "".join( "%s,%.4f,%.4f\n" %location for location in LOCATIONS ) )
+    return str(fname)
+
+
+def writeStations(folder, stations=STATIONS):
+    fname = folder.join("ghcnd-stations.txt")
+    fname.write( "".join( "%-11s %8.4f %9.4f %6.1f    %s\n" %station for station in stations ) )
+    return str(fname)
+
+
+def test_mapper(tmpdir):
+    mapper = WeatherStationMapper(writeStations(tmpdir), writeLocations(tmpdir))
+    assert mapper("ACW00011604") == "ATG"
+    assert mapper("GM000003342") == "DEU"
+
+    # Stations far from any known location and unknown station IDs
+    assert mapper.notFound == ["AYM00089664"]
+    assert np.isnan( mapper("AYM00089664") )
+    assert np.isnan( mapper("XXX00000000") )
+
+
+def test_prebuilt(tmpdir):
+    # The table as written by a build and read by DataContainer
+    data = pd.DataFrame( { "Country": ["ATG", "ATG", "DEU"] ,\
+                           "Year"   : [1980, 1981, 1980]    ,\
+                           "PRCP"   : [2., 0., 1.]          ,\
+                           "TMAX"   : [1., np.nan, 3.]      ,\
+                         }, columns=["Country", "Year", "PRCP", "TMAX"] )
+    fname = tmpdir.join("ghcnd_gsn.csv")
+    data.to_csv(str(fname), index=False)
+
+    climate = WeatherData(fname=str(fname)                          ,\
+                          years=[1980,2015]                         ,\
+                          stationList=writeStations(tmpdir)         ,\
+                          LatLon2Counry=writeLocations(tmpdir)      ,\
+                          )
+    pd.testing.assert_frame_equal(climate.data, data)
+
+
+def writeGhcn(tmpdir):
+    """ The archive of all STATIONS, the last one only measures since 2005 """
+    stations = dict( (station[0], dly(station[0], [1990, 2012], ELEMENTS, seed)) \
+                     for seed, station in enumerate(STATIONS[:-1]) )
+    stations[ STATIONS[-1][0] ] = dly(STATIONS[-1][0], [2005, 2012], ELEMENTS, len(STATIONS))
+    return writeArchive(str(tmpdir.join("ghcnd_gsn.tar.gz")), stations)
+
+
+def build(tmpdir, cache, years=[1990, 2012], **kwargs):
+    return WeatherData(fname=str(tmpdir.join("ghcnd_gsn.tar.gz"))     ,\
+                       years=years                                   ,\
+                       stationList=writeStations(tmpdir)             ,\
+                       LatLon2Counry=writeLocations(tmpdir)          ,\
+                       elements=ELEMENTS                             ,\
+                       firstYear=1995                                ,\
+                       lastYear=2010                                 ,\
+                       cache=str(tmpdir.join(cache))                 ,\
+                       **kwargs )
+
+
+def dropTables(folder):
+    """ Remove the cached tables but keep the station cache """
+    for name in os.listdir(folder):
+        if name != "stations" and os.path.isdir(os.path.join(folder, name)):
+            shutil.rmtree(os.path.join(folder, name))
+
+
+def test_shards(tmpdir):
+    writeGhcn(tmpdir)
+    single = build(tmpdir, "single")
+    assert len(single.data) > 0 and single.data["TMAX"].sum() > 0
+
+    for shard in range(3):
+        assert build(tmpdir, "shards", shard=shard, numShards=3).data is None
+    merged = build(tmpdir, "shards", numShards=3)
+    pd.testing.assert_frame_equal(merged.data, single.data)
+    pd.testing.assert_frame_equal(merged.masks.frame(), single.masks.frame())
+
+    # The shard indexes are merged into the main one
+    stations = os.listdir( str(tmpdir.join("shards", "stations")) )
+    assert [ name for name in stations if name.endswith(".json") ] == ["index.json"]
+
+
+def test_stationCache(tmpdir, capsys):
+    writeGhcn(tmpdir)
+    cold = build(tmpdir, "cache")
+    assert "Parsed %d stations, 0 unchanged" %len(STATIONS) in capsys.readouterr().out
+
+    # Without the tables the stations are taken from the station cache
+    dropTables( str(tmpdir.join("cache")) )
+    warm = build(tmpdir, "cache")
+    assert "Parsed 0 stations, %d unchanged" %len(STATIONS) in capsys.readouterr().out
+    pd.testing.assert_frame_equal(warm.data, cold.data)
+    pd.testing.assert_frame_equal(warm.masks.frame(), cold.masks.frame())
+
+    # Other years have their own entries, the first ones are kept
+    build(tmpdir, "cache", years=[1992, 2012])
+    dropTables( str(tmpdir.join("cache")) )
+    capsys.readouterr()
+    again = build(tmpdir, "cache")
+    assert "Parsed 0 stations, %d unchanged" %len(STATIONS) in capsys.readouterr().out
+    pd.testing.assert_frame_equal(again.data, cold.data)
+
+
+def test_stationCacheMembers(tmpdir):
+    # The same station in two folders of the archive
+    folder = str(tmpdir.join("stations"))
+    cache  = StationCache(folder, [1990, 2012], ELEMENTS)
+    arrays = dict()
+    for i, name in enumerate(["ghcnd_gsn/ACW00011604.dly", "ghcnd_all/ACW00011604.dly"]):
+        member      = tarfile.TarInfo(name)
+        member.size = 100 + i
+        raw         = ("%d" %i).encode()
+        assert cache.load(member, raw) is None
+        arrays[name] = (member, raw, ("ACW00011604", np.array([1990 + i]), np.array([1]), np.array([0]), np.array([i + 0.5])))
+        cache.save(member, arrays[name][2])
+    cache.close()
+
+    cache = StationCache(folder, [1990, 2012], ELEMENTS)
+    for member, raw, expected in arrays.values():
+        loaded = cache.load(member, raw)
+        assert loaded[0] == expected[0]
+        for values, expectedValues in zip(loaded[1:], expected[1:]):
+            assert np.array_equal(values, expectedValues)
+    assert cache.hits == 2
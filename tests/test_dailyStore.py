@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+Build a daily store from a synthetic archive and read the days back.
+"""
+import numpy as np
+
+from climateData import readDly
+from dailyStore import DailyStore
+from ghcnArchive import dly, writeArchive
+
+
+def test_manyElements(tmpdir):
+    # More elements than fit in one byte
+    elements = [ "E%03d" %i for i in range(300) ]
+    stations = dict( (stationID, dly(stationID, [2000, 2000], elements, seed)) \
+                     for seed, stationID in enumerate(["ASN00004000", "GM000003342"]) )
+    archive  = writeArchive(str(tmpdir.join("ghcnd_gsn.tar.gz")), stations)
+
+    store = DailyStore.build(str(tmpdir.join("ghcnd_gsn.store")), archive)
+    assert store.elements == elements
+    assert len(store) == 2 * 12 * len(elements)
+
+    for stationID, content in stations.items():
+        records = readDly(content.encode())
+        span    = store.stationRecords(stationID)
+        assert list(store.elementNames(span)) == [ element.decode() for element in records["element"] ]
+        assert np.array_equal(store.days(span), records["value"])
+
+    records = store.records(stations=["GM000003342"], elements=["E299"], months=[3])
+    assert len(records) == 1
+    assert store.elementNames(records)[0] == "E299"
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Extreme months from the expanding statistics compared with a direct
+computation over the previous years of each series.
+"""
+import numpy as np
+import pandas as pd
+
+from climateData import ExpandingStatistics
+
+
+FACTORS = [0.5, 1., 1.5, 2.]
+
+
+def direct(data, factor):
+    """ The flags computed year by year with np.average and np.std """
+    flags = list()
+    for _, series in data.sort_values(["Station ID", "Year"], kind="mergesort").groupby("Station ID"):
+        for year in sorted(series["Year"].unique()):
+            lastYears = series.loc[ series["Year"] <  year, "Value" ].values
+            thisYear  = series.loc[ series["Year"] == year, "Value" ].values
+            if len(lastYears) == 0:
+                flags.append(False)
+                continue
+            thisYearAvg  = np.average(thisYear)
+            lastYearsAvg = np.average(lastYears)
+            lastYearsStd = np.std(lastYears)
+            flags.append( thisYearAvg > lastYearsAvg + factor*lastYearsStd or \
+                          thisYearAvg < lastYearsAvg - factor*lastYearsStd )
+    return np.array(flags)
+
+
+def test_random():
+    rng  = np.random.RandomState(42)
+    rows = [ (station, year, value) for station in range(20)
+                                    for year in range(1950, 1950 + rng.randint(1, 40))
+                                    for value in 250. + 30*rng.randn(rng.randint(1, 4)) ]
+    data = pd.DataFrame(rows, columns=["Station ID", "Year", "Value"])
+
+    stats = ExpandingStatistics(data, ["Station ID"])
+    for factor in FACTORS:
+        assert np.array_equal( stats.extreme(factor), direct(data, factor) )
+    # All factors at once
+    flags = stats.extreme( np.array(FACTORS)[:, None] )
+    assert np.array_equal( flags, [ direct(data, factor) for factor in FACTORS ] )
+
+
+def test_threshold():
+    # The last year lies exactly on (or next to) the threshold of the
+    # previous years, i.e. the cumulative sums alone cannot decide
+    rows = list()
+    for station, (lastYears, factor) in enumerate( [ ([1., 3.], 1.)             ,\
+                                                     ([0.1, 0.2, 0.3], 1.)      ,\
+                                                     ([0.1, 0.2, 0.3], 2.)      ,\
+                                                     ([271.3, 268.9, 270.4], 1.5) ,\
+                                                     ([-5.5, -4.1], 2.)
+                                                   ] ):
+        average = np.average(lastYears)
+        std     = np.std(lastYears)
+        for thisYear in [ average + factor*std, average - factor*std ,\
+                          np.nextafter(average + factor*std, np.inf) ,\
+                          np.nextafter(average - factor*std, -np.inf) ]:
+            values = lastYears + [thisYear]
+            rows  += [ ((station, thisYear), 2000 + i, value) for i, value in enumerate(values) ]
+    data = pd.DataFrame(rows, columns=["Station ID", "Year", "Value"])
+    data["Station ID"] = data["Station ID"].astype(str)
+
+    stats = ExpandingStatistics(data, ["Station ID"])
+    for factor in FACTORS:
+        assert np.array_equal( stats.extreme(factor), direct(data, factor) )
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Network metrics of a small graph with known values.
+"""
+import numpy as np
+import pandas as pd
+
+from flowMatrix import FlowMatrix
+
+
+# The edges origin -> destination: A -> B, A -> C, B -> C, C -> A (all 1),
+# a self-loop C -> C and flows from "Various/Unknown" (VAR) into B.
+EDGES = [ ("A", "B", 1.) ,\
+          ("A", "C", 1.) ,\
+          ("B", "C", 1.) ,\
+          ("C", "A", 1.) ,\
+          ("C", "C", 5.) ,\
+          ("VAR", "B", 4.)
+        ]
+
+
+def flows():
+    data = pd.DataFrame( [ (2010, destination, origin, value) for origin, destination, value in EDGES ] ,\
+                         columns=["Year", "Country", "Origin", "Value"] )
+    return FlowMatrix(data)
+
+
+def test_network():
+    result = flows().network("Value", topK=1).set_index("Country")
+    assert sorted(result.index) == ["A", "B", "C"] # no VAR
+
+    # PageRank (damping 0.85) of the graph, the solution of
+    # r = (1 - 0.85) / 3 + 0.85 * M r
+    assert np.allclose( result.loc[["A", "B", "C"], "PageRank"], [0.38778971, 0.21481063, 0.39739966] )
+    assert np.isclose( result["PageRank"].sum(), 1 )
+
+    # A and C send each other 1, B has no reciprocated flows
+    assert np.allclose( result.loc[["A", "B", "C"], "Reciprocity"], [2 * 1 / 3., 0, 2 * 1 / 3.] )
+
+    assert np.allclose( result.loc[["A", "B", "C"], "InStrength"],  [1, 1, 2] )
+    assert np.allclose( result.loc[["A", "B", "C"], "OutStrength"], [2, 1, 1] )
+    assert np.allclose( result.loc[["A", "B", "C"], "NetFlow"],     [-1, 0, 1] )
+    assert np.allclose( result.loc[["A", "B", "C"], "TopShare"],    [1, 1, 0.5] )
+
+
+def test_network_options():
+    result = flows().network("Value", selfLoops=True, exclude=()).set_index("Country")
+    assert sorted(result.index) == ["A", "B", "C", "VAR"]
+    assert result.loc["C", "InStrength"] == 2 + 5
+    assert result.loc["B", "InStrength"] == 1 + 4
+    assert np.isclose( result.loc["C", "Reciprocity"], 2 * (1 + 5) / (7 + 6.) )
+    assert np.isclose( result["PageRank"].sum(), 1 )
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+Store tables and file hashes in a small cache folder.
+"""
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+from tableCache import TableCache
+
+
+def test_roundtrip(tmpdir):
+    cache = TableCache(str(tmpdir.join("cache")))
+    data  = pd.DataFrame( { "Country": ["ATG", "DEU", "ATG"]                         ,\
+                            "Year"   : np.array([1980, 1980, 1981], dtype=np.int16) ,\
+                            "PRCP"   : [1., np.nan, 2.]
+                          }, columns=["Country", "Year", "PRCP"] )
+    key = cache.key(years=[1980, 1981])
+    assert cache.load(key) is None
+    cache.save(key, data, {"years": [1980, 1981]})
+    pd.testing.assert_frame_equal(cache.load(key), data)
+
+
+def test_fileHash(tmpdir):
+    cache = TableCache(str(tmpdir.join("cache")))
+    fname = tmpdir.join("input.txt")
+    fname.write("some input")
+    first = cache.fileHash(str(fname))
+    assert cache.fileHash(str(fname)) == first
+
+    # The hashes are written in one piece, no temporary file is left over
+    assert os.listdir(cache.folder) == ["hashes.json"]
+    with open(cache.fnameHashes, 'r') as f:
+        assert json.load(f)[ os.path.abspath(str(fname)) ]["sha1"] == first
+
+    fname.write("other input")
+    os.utime(str(fname), (0, 0))
+    assert cache.fileHash(str(fname)) != first
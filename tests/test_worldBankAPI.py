@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Download indicators from the local World Bank stub.
+"""
+import os
+import time
+
+from worldBankAPI import WorldBankAPI
+from worldBankStub import WorldBankStub
+from WorldBankData import WorldBankData
+
+
+GDP = ( "GDP (current US$)", [ ("DEU", "Germany", 2010, 3.4e12) ,\
+                               ("DEU", "Germany", 2011, 3.7e12) ,\
+                               ("FRA", "France",  2010, 2.6e12) ,\
+                               ("FRA", "France",  2011, None)   ,\
+                               ("ITA", "Italy",   2010, 2.1e12)
+                             ] )
+POP = ( "Population, total",  [ ("DEU", "Germany", 2010, 81.8e6) ,\
+                               ("FRA", "France",  2010, 65.0e6)
+                             ] )
+
+
+def waitClosed(stub, timeout=5):
+    """ The server notices closed connections with a delay """
+    end = time.time() + timeout
+    while stub.closed < stub.connections and time.time() < end:
+        time.sleep(0.01)
+    return stub.closed
+
+
+def test_download(tmpdir):
+    folder = str(tmpdir)
+    stub = WorldBankStub({"NY.GDP.MKTP.CD": GDP, "SP.POP.TOTL": POP})
+    with stub as url:
+        api  = WorldBankAPI(folder, url=url, workers=3, perPage=2)
+
+        status = api(["NY.GDP.MKTP.CD", "SP.POP.TOTL"])
+        assert status == {"NY.GDP.MKTP.CD": "updated", "SP.POP.TOTL": "updated"}
+        assert stub.requests[200] == 3 + 1 # three pages of GDP, one of population
+        assert os.path.isfile(api.fname("NY.GDP.MKTP.CD"))
+
+        # All keep-alive connections are closed once the download finished
+        assert stub.connections > 0
+        assert waitClosed(stub) == stub.connections
+
+        # Unchanged indicators cost one "304 Not Modified" each
+        status = api(["NY.GDP.MKTP.CD", "SP.POP.TOTL"])
+        assert status == {"NY.GDP.MKTP.CD": "unchanged", "SP.POP.TOTL": "unchanged"}
+        assert stub.requests[304] == 2
+        assert waitClosed(stub) == stub.connections
+
+        # A changed indicator is downloaded again
+        stub.add("SP.POP.TOTL", POP[0], POP[1] + [("ITA", "Italy", 2010, 59.3e6)])
+        assert api(["SP.POP.TOTL"]) == {"SP.POP.TOTL": "updated"}
+
+        assert api(["NO.SUCH.CODE"]) == {"NO.SUCH.CODE": "failed"}
+
+    # The files are read by WorldBankData
+    data = WorldBankData(folder).data.set_index(["Country", "Year"])
+    assert data.loc[("DEU", 2011), "NY.GDP.MKTP.CD"] == 3.7e12
+    assert data.loc[("ITA", 2010), "SP.POP.TOTL"]    == 59.3e6
+    assert data["NY.GDP.MKTP.CD"].isnull().loc[("FRA", 2011)]
+
+
+def test_timeout(tmpdir):
+    stub = WorldBankStub({"SP.POP.TOTL": POP})
+    with stub as url:
+        api = WorldBankAPI(str(tmpdir), url=url, workers=1, timeout=0.2)
+        stub.delays.append(1.) # the first request times out and is sent again
+        assert api(["SP.POP.TOTL"]) == {"SP.POP.TOTL": "updated"}
+        assert stub.connections == 2 # a fresh connection for the retry
+        assert waitClosed(stub) == stub.connections